@@ -0,0 +1,117 @@
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+
+# Sin barras de progreso, resúmenes ni caché en disco del usuario: cada escenario crea la suya
+os.environ["POKE_PROGRESS"] = "0"
+os.environ["POKE_METRICS"] = "0"
+os.environ["POKECACHE_PATH"] = ""
+
+import pokecode
+from fixture_server import FixtureServer, synthetic_fixtures, load_fixtures
+
+
+def configure(base_url, concurrency, cache_path=None, rate=0.0):
+    """Apunta pokecode al servidor local con la concurrencia y la caché del escenario"""
+    pokecode.BASE_URL = base_url
+    pokecode.CONCURRENCY = concurrency
+    pokecode.SESSION = pokecode.build_session(concurrency)
+    pokecode.CACHE = pokecode.ResponseCache(cache_path) if cache_path else None
+    pokecode.SCHEDULER = pokecode.RequestScheduler(rate, concurrency) if rate > 0 else None
+
+
+def measure(server, consulta, limit):
+    """Ejecuta una consulta desde cero (índice de evoluciones vacío) y mide tiempo y peticiones"""
+    pokecode.EVOLUCIONES = pokecode.EvolutionIndex()
+    server.reset_counts()
+    inicio = time.perf_counter()
+    if consulta == "run_analyses":
+        pokecode.run_analyses(limit=limit)
+    else:
+        pokecode.run_single(consulta, limit)
+    return {"segundos": round(time.perf_counter() - inicio, 4), "peticiones": server.counts["total"]}
+
+
+def run_benchmarks(server, consultas, concurrencias, limit, rate=0.0):
+    """Mide cada consulta con cada concurrencia y modo de caché; devuelve una lista de filas"""
+    filas = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for conc in concurrencias:
+            for consulta in consultas:
+                configure(server.base_url, conc, rate=rate)
+                filas.append({"consulta": consulta, "modo": "sin caché", "concurrencia": conc,
+                              **measure(server, consulta, limit)})
+                # La misma caché se usa dos veces: primero vacía, después llena
+                configure(server.base_url, conc, os.path.join(tmp, f"{consulta}-{conc}.sqlite"), rate)
+                for modo in ("caché fría", "caché caliente"):
+                    filas.append({"consulta": consulta, "modo": modo, "concurrencia": conc,
+                                  **measure(server, consulta, limit)})
+                pokecode.CACHE.conn.close()
+    return filas
+
+
+def compare(filas, baseline, tolerance):
+    """Lista de regresiones frente a una corrida anterior (más peticiones o más tiempo)"""
+    previas = {(f["consulta"], f["modo"], f["concurrencia"]): f for f in baseline}
+    regresiones = []
+    for fila in filas:
+        previa = previas.get((fila["consulta"], fila["modo"], fila["concurrencia"]))
+        if not previa:
+            continue
+        if fila["peticiones"] > previa["peticiones"]:
+            regresiones.append(f"{fila['consulta']} [{fila['modo']}, c={fila['concurrencia']}]: "
+                               f"{previa['peticiones']} -> {fila['peticiones']} peticiones")
+        if fila["segundos"] > previa["segundos"] * (1 + tolerance):
+            regresiones.append(f"{fila['consulta']} [{fila['modo']}, c={fila['concurrencia']}]: "
+                               f"{previa['segundos']:.3f}s -> {fila['segundos']:.3f}s")
+    return regresiones
+
+
+def print_table(filas):
+    print(f"{'consulta':<24}{'modo':<16}{'conc':>5}{'tiempo (s)':>12}{'peticiones':>12}")
+    for f in filas:
+        print(f"{f['consulta']:<24}{f['modo']:<16}{f['concurrencia']:>5}"
+              f"{f['segundos']:>12.3f}{f['peticiones']:>12}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark de las consultas de pokecode contra la PokeAPI local")
+    parser.add_argument("--fixtures", help="Archivo .json.gz grabado (por defecto datos sintéticos)")
+    parser.add_argument("--synthetic", type=int, default=1025, help="Pokémon sintéticos si no hay fixtures")
+    parser.add_argument("--consultas", nargs="+", choices=list(pokecode.CONSULTAS) + ["run_analyses"],
+                        default=list(pokecode.CONSULTAS) + ["run_analyses"])
+    parser.add_argument("--concurrencia", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--limit", type=int, default=500, help="Último id (excluido) en los recorridos por id")
+    parser.add_argument("--latency", type=float, default=0.005, help="Latencia inyectada por petición (s)")
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--rate", type=float, default=0.0, help="Límite del scheduler (0 = sin límite)")
+    parser.add_argument("--json", help="Guarda los resultados en este archivo")
+    parser.add_argument("--baseline", help="Resultados previos (JSON) para detectar regresiones")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Margen de tiempo aceptado frente al baseline")
+    args = parser.parse_args()
+
+    docs = load_fixtures(args.fixtures) if args.fixtures else synthetic_fixtures(args.synthetic)
+    server = FixtureServer(docs, latency=args.latency, jitter=args.jitter,
+                           error_rate=args.error_rate, throttle_rate=args.throttle_rate)
+    server.start()
+    pokecode.BACKOFF_BASE = min(pokecode.BACKOFF_BASE, 0.05)  # los errores inyectados no deben dominar el tiempo
+    try:
+        filas = run_benchmarks(server, args.consultas, args.concurrencia, args.limit, args.rate)
+    finally:
+        server.stop()
+
+    print_table(filas)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(filas, f, ensure_ascii=False, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regresiones = compare(filas, json.load(f), args.tolerance)
+        for r in regresiones:
+            print("❌", r)
+        sys.exit(1 if regresiones else 0)
@@ -0,0 +1,254 @@
+import os
+import re
+import gzip
+import json
+import time
+import zlib
+import random
+import sqlite3
+import hashlib
+import argparse
+import threading
+from collections import Counter
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# URL base que aparece dentro de los documentos grabados; se reescribe a la del servidor local
+POKEAPI_BASE = "https://pokeapi.co/api/v2"
+FAMILIAS = ("type", "pokemon", "pokemon-species", "evolution-chain")
+
+TIPOS = ["normal", "fire", "water", "electric", "grass", "ice", "fighting", "poison", "ground",
+         "flying", "psychic", "bug", "rock", "ghost", "dragon", "dark", "steel", "fairy"]
+HABITATS = ["cave", "forest", "grassland", "mountain", "rare", "rough-terrain", "sea", "urban", "waters-edge"]
+STATS = ["hp", "attack", "defense", "special-attack", "special-defense", "speed"]
+
+
+def normalize_path(path):
+    """'/api/v2/pokemon/25/?x=1' -> '/pokemon/25'"""
+    path = path.split("?", 1)[0].rstrip("/")
+    if path.startswith("/api/v2"):
+        path = path[len("/api/v2"):]
+    return path or "/"
+
+
+# ------------------------------
+# 🔹 Datos de prueba
+# ------------------------------
+
+def record_fixtures(cache_path, out_path):
+    """Exporta las respuestas guardadas en la caché de pokecode a un .json.gz de fixtures"""
+    conn = sqlite3.connect(cache_path)
+    docs = {}
+    for url, body in conn.execute("SELECT url, body FROM responses"):
+        if not url.startswith(POKEAPI_BASE):
+            continue
+        path = normalize_path(url[len(POKEAPI_BASE):])
+        if path.split("/")[1] in FAMILIAS:
+            docs[path] = json.loads(zlib.decompress(body))
+    conn.close()
+    save_fixtures(docs, out_path)
+    return len(docs)
+
+
+def save_fixtures(docs, path):
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        json.dump(docs, f)
+
+
+def load_fixtures(path):
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def synthetic_fixtures(n_pokemon=1025, n_forms=60, seed=0):
+    """Genera una Pokédex sintética y coherente (mismas formas de documento que la PokeAPI).
+
+    Sirve para medir sin depender de datos grabados: cadenas de 1 a 3 species,
+    formas alternativas con id > 10000, legendarios, hábitats y dos tipos como máximo.
+    """
+    rng = random.Random(seed)
+    docs = {}
+
+    def ref(family, id_, name):
+        return {"name": name, "url": f"{POKEAPI_BASE}/{family}/{id_}/"}
+
+    names = {i: f"poke-{i}" for i in range(1, n_pokemon + 1)}
+    names[1] = "bulbasaur"  # el inicial que usa cadena_evolutiva por defecto
+    chains, i = [], 1
+    while i <= n_pokemon:
+        size = min(rng.choice([1, 1, 2, 3, 3]), n_pokemon - i + 1)
+        chains.append(list(range(i, i + size)))
+        i += size
+
+    for cid, members in enumerate(chains, 1):
+        def nodo(k):
+            return {"species": ref("pokemon-species", members[k], names[members[k]]),
+                    "evolves_to": [nodo(k + 1)] if k + 1 < len(members) else []}
+
+        docs[f"/evolution-chain/{cid}"] = {"id": cid, "chain": nodo(0)}
+        legendario = len(members) == 1 and rng.random() < 0.15
+        for k, sid in enumerate(members):
+            docs[f"/pokemon-species/{sid}"] = {
+                "id": sid,
+                "name": names[sid],
+                "is_legendary": legendario,
+                "is_mythical": len(members) == 1 and not legendario and rng.random() < 0.05,
+                "habitat": {"name": rng.choice(HABITATS), "url": ""} if rng.random() < 0.8 else None,
+                "evolves_from_species": ref("pokemon-species", members[k - 1], names[members[k - 1]]) if k else None,
+                "evolution_chain": {"url": f"{POKEAPI_BASE}/evolution-chain/{cid}/"},
+            }
+
+    pokemon = [(i, names[i], i) for i in range(1, n_pokemon + 1)]
+    for k in range(n_forms):
+        base = rng.randint(1, n_pokemon)
+        pokemon.append((10001 + k, f"{names[base]}-forma-{k}", base))
+
+    by_type = {t: [] for t in TIPOS}
+    for pid, name, sid in pokemon:
+        tipos = rng.sample(TIPOS, rng.choice([1, 2]))
+        docs[f"/pokemon/{pid}"] = {
+            "id": pid,
+            "name": name,
+            "height": rng.randint(1, 40),
+            "weight": rng.randint(1, 4000),
+            "types": [{"slot": s + 1, "type": {"name": t, "url": ""}} for s, t in enumerate(tipos)],
+            "stats": [{"base_stat": rng.randint(5, 200), "stat": {"name": st, "url": ""}} for st in STATS],
+            "species": ref("pokemon-species", sid, names[sid]),
+        }
+        for s, t in enumerate(tipos):
+            by_type[t].append({"slot": s + 1, "pokemon": ref("pokemon", pid, name)})
+
+    for t, entries in by_type.items():
+        docs[f"/type/{t}"] = {"name": t, "pokemon": entries}
+    docs["/pokemon"] = {"count": len(pokemon), "results": [ref("pokemon", pid, name) for pid, name, _ in pokemon]}
+    docs["/evolution-chain"] = {"count": len(chains),
+                                "results": [{"url": f"{POKEAPI_BASE}/evolution-chain/{c}/"}
+                                            for c in range(1, len(chains) + 1)]}
+    return docs
+
+
+# ------------------------------
+# 🔹 Servidor
+# ------------------------------
+
+class FixtureServer:
+    """Sustituto local de la PokeAPI que sirve documentos grabados o sintéticos.
+
+    Permite inyectar latencia (con jitter) y una tasa de errores 503 o 429, y cuenta
+    las peticiones recibidas por familia de endpoint para detectar regresiones.
+    """
+
+    def __init__(self, docs, host="127.0.0.1", port=0, latency=0.0, jitter=0.0,
+                 error_rate=0.0, throttle_rate=0.0, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.rng = random.Random(seed)
+        self.counts = Counter()
+        self.lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, port), self._handler())
+        self.httpd.daemon_threads = True
+        self.base_url = f"http://{host}:{self.httpd.server_port}/api/v2"
+        self.bodies = self._prepare(docs)
+        self.thread = None
+
+    def _prepare(self, docs):
+        """Serializa cada documento una vez, con URLs locales, y agrega alias por nombre e id"""
+        bodies = {}
+        for path, doc in docs.items():
+            body = json.dumps(doc).replace(POKEAPI_BASE, self.base_url).encode()
+            bodies[path] = (body, '"%s"' % hashlib.sha1(body).hexdigest())
+        for path, doc in docs.items():
+            family = path.split("/")[1]
+            if family in ("pokemon", "pokemon-species") and path.count("/") == 2:
+                for alias in (doc.get("name"), doc.get("id")):
+                    if alias is not None:
+                        bodies.setdefault(f"/{family}/{alias}", bodies[path])
+        return bodies
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive, como la API real
+            disable_nagle_algorithm = True  # cabeceras y cuerpo van en escrituras separadas
+
+            def do_GET(self):
+                path = normalize_path(self.path)
+                family = re.sub(r"^/([^/]*).*", r"\1", path)
+                with server.lock:
+                    server.counts[family] += 1
+                    server.counts["total"] += 1
+                    roll = server.rng.random()
+                    delay = server.latency + server.rng.uniform(0, server.jitter)
+                if delay:
+                    time.sleep(delay)
+
+                if roll < server.throttle_rate:
+                    return self._send(429, b"", {"Retry-After": "1"})
+                if roll < server.throttle_rate + server.error_rate:
+                    return self._send(503, b"")
+                if path not in server.bodies:
+                    return self._send(404, b'{"detail": "Not found."}')
+                body, etag = server.bodies[path]
+                if self.headers.get("If-None-Match") == etag:
+                    return self._send(304, b"", {"ETag": etag})
+                self._send(200, body, {"ETag": etag, "Content-Type": "application/json"})
+
+            def _send(self, status, body, headers=None):
+                self.send_response(status)
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self.base_url
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def reset_counts(self):
+        with self.lock:
+            self.counts.clear()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="PokeAPI local para pruebas y benchmarks")
+    sub = parser.add_subparsers(dest="comando", required=True)
+
+    rec = sub.add_parser("record", help="Exporta la caché de pokecode a un archivo de fixtures")
+    rec.add_argument("--cache", default=os.getenv("POKECACHE_PATH", "pokecache.sqlite"))
+    rec.add_argument("--out", default="fixtures.json.gz")
+
+    srv = sub.add_parser("serve", help="Sirve fixtures grabados o sintéticos")
+    srv.add_argument("--fixtures", help="Archivo .json.gz (por defecto datos sintéticos)")
+    srv.add_argument("--synthetic", type=int, default=1025, help="Pokémon sintéticos si no hay fixtures")
+    srv.add_argument("--port", type=int, default=8000)
+    srv.add_argument("--latency", type=float, default=0.0, help="Latencia por petición en segundos")
+    srv.add_argument("--jitter", type=float, default=0.0, help="Latencia aleatoria extra en segundos")
+    srv.add_argument("--error-rate", type=float, default=0.0, help="Fracción de respuestas 503")
+    srv.add_argument("--throttle-rate", type=float, default=0.0, help="Fracción de respuestas 429")
+    args = parser.parse_args()
+
+    if args.comando == "record":
+        print(f"💾 {record_fixtures(args.cache, args.out)} documentos guardados en {args.out}")
+    else:
+        docs = load_fixtures(args.fixtures) if args.fixtures else synthetic_fixtures(args.synthetic)
+        server = FixtureServer(docs, port=args.port, latency=args.latency, jitter=args.jitter,
+                               error_rate=args.error_rate, throttle_rate=args.throttle_rate)
+        print(f"🧪 PokeAPI local en {server.base_url} ({len(docs)} documentos)")
+        print(f"   Usa: BASE_URL = \"{server.base_url}\"")
+        try:
+            server.httpd.serve_forever()
+        except KeyboardInterrupt:
+            server.stop()
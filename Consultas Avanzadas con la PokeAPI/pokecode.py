@@ -1,154 +1,939 @@
+import os
+import time
+import asyncio
+import threading
+import zlib
+import random
+import sqlite3
+import argparse
+import functools
+import contextvars
 import requests
 import json
+import numpy as np
+from collections import namedtuple, defaultdict
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 from tqdm import tqdm
 
 BASE_URL = "https://pokeapi.co/api/v2"
 
+# Caché persistente de respuestas (SQLite, cuerpos comprimidos con zlib)
+CACHE_PATH = os.getenv("POKECACHE_PATH", "pokecache.sqlite")
+CACHE_TTL = int(os.getenv("POKECACHE_TTL", str(7 * 24 * 3600)))  # segundos
+
+# Peticiones simultáneas máximas en las descargas en paralelo (fetch_many)
+CONCURRENCY = int(os.getenv("POKE_CONCURRENCY", "16"))
+PROGRESS = os.getenv("POKE_PROGRESS", "1") != "0"  # barras de tqdm
+
+# Conexiones HTTP: pool keep-alive, timeout y reintentos con backoff exponencial + jitter
+POOL_SIZE = int(os.getenv("POKE_POOL_SIZE", str(CONCURRENCY)))
+REQUEST_TIMEOUT = float(os.getenv("POKE_TIMEOUT", "10"))  # segundos
+MAX_RETRIES = int(os.getenv("POKE_MAX_RETRIES", "5"))
+BACKOFF_BASE = float(os.getenv("POKE_BACKOFF_BASE", "0.5"))  # segundos
+BACKOFF_MAX = float(os.getenv("POKE_BACKOFF_MAX", "30"))  # segundos
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+# Límite de ritmo (token bucket) para las peticiones que salen a la red; POKE_RATE=0 lo desactiva
+RATE_LIMIT = float(os.getenv("POKE_RATE", "50"))  # peticiones por segundo sostenidas
+RATE_BURST = int(os.getenv("POKE_BURST", str(CONCURRENCY)))
+
+# Instrumentación de get_json: resumen al final de cada consulta y, opcionalmente, volcado JSON
+METRICS_ENABLED = os.getenv("POKE_METRICS", "1") != "0"
+METRICS_JSON = os.getenv("POKE_METRICS_JSON")  # ruta del archivo JSON (vacío = no se guarda)
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+# Snapshot columnar de la Pokédex para consultas sin red
+SNAPSHOT_PATH = os.getenv("POKEDEX_SNAPSHOT", "pokedex.npz")
+STAT_NAMES = ["hp", "attack", "defense", "special-attack", "special-defense", "speed"]
+
+# Regiones por rango de número de Pokédex nacional
+KANTO = range(1, 152)
+JOHTO = range(152, 252)
+
+CacheEntry = namedtuple("CacheEntry", "body etag last_modified fetched_at")
+
+
+class ResponseCache:
+    """Caché en disco de respuestas HTTP indexada por URL, con TTL y revalidación"""
+
+    def __init__(self, path=CACHE_PATH, ttl=CACHE_TTL):
+        self.ttl = ttl
+        # La conexión se comparte entre los hilos de fetch_many, protegida por un lock
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS responses (
+                   url TEXT PRIMARY KEY,
+                   body BLOB NOT NULL,
+                   etag TEXT,
+                   last_modified TEXT,
+                   fetched_at REAL NOT NULL
+               )"""
+        )
+        self.conn.commit()
+        self.stats = {"hits": 0, "misses": 0, "revalidated": 0, "bytes_saved": 0}
+
+    def get(self, url):
+        """Devuelve la entrada guardada para la URL (cuerpo ya descomprimido) o None"""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT body, etag, last_modified, fetched_at FROM responses WHERE url = ?", (url,)
+            ).fetchone()
+        if not row:
+            return None
+        return CacheEntry(zlib.decompress(row[0]), row[1], row[2], row[3])
+
+    def put(self, url, body, etag=None, last_modified=None):
+        """Guarda (o reemplaza) la respuesta de una URL"""
+        blob = zlib.compress(body)
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                (url, blob, etag, last_modified, time.time()),
+            )
+            self.conn.commit()
+
+    def touch(self, url):
+        """Renueva el TTL de una entrada revalidada con 304 Not Modified"""
+        with self.lock:
+            self.conn.execute("UPDATE responses SET fetched_at = ? WHERE url = ?", (time.time(), url))
+            self.conn.commit()
+
+    def is_fresh(self, entry):
+        return time.time() - entry.fetched_at < self.ttl
+
+    def count(self, kind, nbytes=0):
+        """Suma un evento ('hits', 'misses' o 'revalidated') a las estadísticas"""
+        with self.lock:
+            self.stats[kind] += 1
+            self.stats["bytes_saved"] += nbytes
+
+    def report(self):
+        """Imprime hits, misses y bytes ahorrados de la ejecución actual"""
+        s = self.stats
+        total = s["hits"] + s["revalidated"] + s["misses"]
+        ratio = (s["hits"] + s["revalidated"]) / total * 100 if total else 0.0
+        print(
+            f"📦 Caché: {s['hits']} hits, {s['revalidated']} revalidados (304), "
+            f"{s['misses']} misses ({ratio:.1f}% aciertos), "
+            f"{s['bytes_saved'] / 1024:.1f} KiB ahorrados"
+        )
+
+
+# Se puede desactivar con POKECACHE_PATH="" (todas las peticiones van a la red)
+CACHE = ResponseCache() if CACHE_PATH else None
+
+
+class RequestMetrics:
+    """Métricas de get_json por familia de endpoint (type, pokemon, pokemon-species...).
+
+    Por familia guarda: peticiones, histograma de latencia de red, bytes recibidos,
+    tiempo de decodificación JSON, hits/misses/revalidaciones de caché, reintentos y errores.
+    Sirve para ver si una corrida lenta está limitada por la red, por el decode
+    o por descargas redundantes.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.history = {}
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.families = defaultdict(lambda: {
+                "requests": 0, "hits": 0, "misses": 0, "revalidated": 0, "errors": 0, "retries": 0,
+                "bytes": 0, "latency_s": 0.0, "decode_s": 0.0,
+                "latency_hist": [0] * (len(LATENCY_BUCKETS_MS) + 1),
+            })
+
+    @staticmethod
+    def family(url):
+        path = url[len(BASE_URL):] if url.startswith(BASE_URL) else url
+        return path.strip("/").split("/")[0].split("?")[0] or "/"
+
+    def record(self, url, kind, latency=None, nbytes=0, decode=0.0):
+        """kind: 'hits' (caché vigente), 'revalidated' (304), 'misses' (200 de la red) o 'errors'"""
+        with self.lock:
+            fam = self.families[self.family(url)]
+            fam["requests"] += 1
+            fam[kind] += 1
+            fam["bytes"] += nbytes
+            fam["decode_s"] += decode
+            if latency is not None:
+                fam["latency_s"] += latency
+                ms = latency * 1000
+                fam["latency_hist"][next((k for k, b in enumerate(LATENCY_BUCKETS_MS) if ms <= b),
+                                         len(LATENCY_BUCKETS_MS))] += 1
+
+    def retry(self, url):
+        with self.lock:
+            self.families[self.family(url)]["retries"] += 1
+
+    def summary(self):
+        with self.lock:
+            return {name: dict(fam, latency_hist=list(fam["latency_hist"])) for name, fam in self.families.items()}
+
+    @staticmethod
+    def percentile(hist, q):
+        """Percentil aproximado (límite superior del bucket) a partir del histograma"""
+        total = sum(hist)
+        if not total:
+            return None
+        acumulado = 0
+        for k, n in enumerate(hist):
+            acumulado += n
+            if acumulado >= q * total:
+                return LATENCY_BUCKETS_MS[k] if k < len(LATENCY_BUCKETS_MS) else float("inf")
+
+    def report(self, consulta, elapsed):
+        """Imprime el resumen de la consulta y lo agrega al volcado JSON si está configurado"""
+        familias = self.summary()
+        if METRICS_JSON:
+            self.history[consulta] = {"segundos": round(elapsed, 4), "familias": familias}
+            with open(METRICS_JSON, "w", encoding="utf-8") as f:
+                json.dump(self.history, f, ensure_ascii=False, indent=2)
+        print(f"📊 {consulta}: {elapsed:.2f} s")
+        print(f"   {'familia':<18}{'pet.':>6}{'hits':>6}{'304':>5}{'red':>6}{'err':>5}{'reint.':>7}"
+              f"{'KiB':>9}{'red p50/p95 ms':>16}{'decode ms':>11}")
+        for name, fam in sorted(familias.items()):
+            p50 = self.percentile(fam["latency_hist"], 0.5)
+            p95 = self.percentile(fam["latency_hist"], 0.95)
+            red = f"≤{p50}/≤{p95}" if p50 is not None else "-"
+            print(f"   {name:<18}{fam['requests']:>6}{fam['hits']:>6}{fam['revalidated']:>5}{fam['misses']:>6}"
+                  f"{fam['errors']:>5}{fam['retries']:>7}{fam['bytes'] / 1024:>9.1f}"
+                  f"{red:>16}{fam['decode_s'] * 1000:>11.1f}")
+
+
+METRICS = RequestMetrics()
+
+# Profundidad de consultas instrumentadas en curso (solo la más externa imprime el resumen)
+_CONSULTA_ACTIVA = contextvars.ContextVar("consulta_activa", default=False)
+
+def instrumentado(func):
+    """Reinicia las métricas al empezar la consulta y muestra el resumen al terminar"""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if _CONSULTA_ACTIVA.get() or not METRICS_ENABLED:
+            return func(*args, **kwargs)
+        token = _CONSULTA_ACTIVA.set(True)
+        METRICS.reset()
+        inicio = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _CONSULTA_ACTIVA.reset(token)
+            METRICS.report(func.__name__, time.perf_counter() - inicio)
+    return wrapper
+
+
+def build_session(pool_size=POOL_SIZE):
+    """Crea una sesión con keep-alive que reutiliza hasta pool_size conexiones por host"""
+    session = requests.Session()
+    mount_pool(session, pool_size)
+    return session
+
+def mount_pool(session, pool_size):
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.pool_size = pool_size
+
+
+# Sesión compartida por get_json y los hilos de fetch_many
+SESSION = build_session()
+
+
+class RequestScheduler:
+    """Token bucket compartido por todas las peticiones de red, con carril prioritario.
+
+    Las peticiones interactivas (ver interactive()) toman el siguiente token antes que
+    cualquier petición masiva que esté esperando. Ante un 429 se pausa a todos los
+    hilos durante el Retry-After y se reduce el ritmo a la mitad; cada respuesta
+    correcta lo vuelve a subir poco a poco hasta el máximo configurado.
+    """
+
+    def __init__(self, rate=RATE_LIMIT, burst=RATE_BURST):
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.interactive_waiting = 0
+        self.cond = threading.Condition()
+
+    def acquire(self, interactive=False):
+        """Bloquea hasta que haya un token disponible para este carril"""
+        with self.cond:
+            if interactive:
+                self.interactive_waiting += 1
+            try:
+                while True:
+                    now = time.monotonic()
+                    self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                    self.updated = now
+                    wait = self.paused_until - now
+                    if wait <= 0 and not interactive and self.interactive_waiting:
+                        wait = 1 / self.rate  # cede el turno al carril interactivo
+                    elif wait <= 0:
+                        if self.tokens >= 1:
+                            self.tokens -= 1
+                            return
+                        wait = (1 - self.tokens) / self.rate
+                    self.cond.wait(wait)
+            finally:
+                if interactive:
+                    self.interactive_waiting -= 1
+                    self.cond.notify_all()
+
+    def throttled(self, delay):
+        """El servidor respondió 429: pausa de delay segundos para todos y ritmo a la mitad"""
+        with self.cond:
+            self.rate = max(self.max_rate / 32, self.rate / 2)
+            self.tokens = min(self.tokens, 0.0)
+            self.paused_until = max(self.paused_until, time.monotonic() + delay)
+
+    def succeeded(self):
+        """Recuperación aditiva del ritmo después de un 429"""
+        if self.rate < self.max_rate:
+            with self.cond:
+                self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+
+SCHEDULER = RequestScheduler() if RATE_LIMIT > 0 else None
+
+# Prioridad de las peticiones del contexto actual (se propaga a los hilos de fetch_many)
+INTERACTIVO = contextvars.ContextVar("interactivo", default=False)
+
+@contextmanager
+def interactive():
+    """Marca las peticiones hechas dentro del bloque como interactivas (carril prioritario)"""
+    token = INTERACTIVO.set(True)
+    try:
+        yield
+    finally:
+        INTERACTIVO.reset(token)
+
+
+def backoff_delay(attempt, retry_after=None):
+    """Segundos a esperar antes del reintento número attempt (0, 1, 2...)"""
+    if retry_after:
+        try:
+            return min(BACKOFF_MAX, float(retry_after))
+        except ValueError:
+            pass  # Retry-After como fecha HTTP: se usa el backoff normal
+    # "Full jitter": aleatorio entre 0 y el tope exponencial, para no sincronizar reintentos
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+
+def http_get(url, headers=None):
+    """GET con timeout que reintenta errores de conexión y respuestas 429/5xx"""
+    for attempt in range(MAX_RETRIES + 1):
+        if SCHEDULER:
+            SCHEDULER.acquire(INTERACTIVO.get())
+        try:
+            resp = SESSION.get(url, headers=headers, timeout=REQUEST_TIMEOUT)
+        except (requests.ConnectionError, requests.Timeout):
+            if attempt == MAX_RETRIES:
+                raise
+            METRICS.retry(url)
+            time.sleep(backoff_delay(attempt))
+            continue
+        if resp.status_code not in RETRY_STATUS or attempt == MAX_RETRIES:
+            if SCHEDULER and resp.status_code < 400:
+                SCHEDULER.succeeded()
+            return resp
+        METRICS.retry(url)
+        delay = backoff_delay(attempt, resp.headers.get("Retry-After"))
+        if SCHEDULER and resp.status_code == 429:
+            # La pausa del scheduler frena a todos los hilos, no solo a este
+            SCHEDULER.throttled(delay)
+        else:
+            time.sleep(delay)
+
+
 def get_json(url):
-    """Realiza una petición HTTP y devuelve JSON con manejo de errores"""
+    """Realiza una petición HTTP y devuelve JSON con manejo de errores.
+
+    Si la URL está en caché y no ha vencido, no se toca la red. Si venció,
+    se revalida con If-None-Match / If-Modified-Since y un 304 reutiliza el cuerpo guardado.
+    """
+    entry = CACHE.get(url) if CACHE else None
+    if entry and CACHE.is_fresh(entry):
+        CACHE.count("hits", len(entry.body))
+        inicio = time.perf_counter()
+        data = json.loads(entry.body)
+        METRICS.record(url, "hits", decode=time.perf_counter() - inicio)
+        return data
+
+    headers = {}
+    if entry:
+        if entry.etag:
+            headers["If-None-Match"] = entry.etag
+        if entry.last_modified:
+            headers["If-Modified-Since"] = entry.last_modified
     try:
-        resp = requests.get(url)
+        resp = http_get(url, headers=headers)
+        # elapsed mide solo el último intento en la red (sin esperas del scheduler ni backoff)
+        latencia = resp.elapsed.total_seconds()
+        if entry and resp.status_code == 304:
+            CACHE.touch(url)
+            CACHE.count("revalidated", len(entry.body))
+            inicio = time.perf_counter()
+            data = json.loads(entry.body)
+            METRICS.record(url, "revalidated", latencia, decode=time.perf_counter() - inicio)
+            return data
         resp.raise_for_status()
-        return resp.json()
+        if CACHE:
+            CACHE.count("misses")
+            CACHE.put(url, resp.content, resp.headers.get("ETag"), resp.headers.get("Last-Modified"))
+        inicio = time.perf_counter()
+        data = resp.json()
+        METRICS.record(url, "misses", latencia, len(resp.content), time.perf_counter() - inicio)
+        return data
     except requests.RequestException as e:
+        METRICS.record(url, "errors")
         print(f"Error al acceder a {url}: {e}")
         return None
 
-def get_pokemon_by_type(tipo):
-    """Devuelve lista de pokémon de un tipo específico"""
+# Pools de hilos de fetch_many, uno por nivel de concurrencia, creados al primer uso y
+# reutilizados en todas las llamadas (incluidas las de EvolutionIndex.ensure)
+_POOLS = {}
+_POOLS_LOCK = threading.Lock()
+_POOL_PREFIX = "fetch_many"
+
+def _pool(workers):
+    with _POOLS_LOCK:
+        # Con más hilos que conexiones, urllib3 descarta las sobrantes y cada petición
+        # extra abre una conexión nueva: el pool de la sesión crece hasta workers
+        if workers > getattr(SESSION, "pool_size", 0):
+            mount_pool(SESSION, workers)
+        pool = _POOLS.get(workers)
+        if pool is None:
+            pool = _POOLS[workers] = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=_POOL_PREFIX)
+        return pool
+
+def fetch_many(urls, concurrency=None, desc=None):
+    """Descarga varias URLs en paralelo y devuelve los JSON en el mismo orden.
+
+    Las URLs repetidas se piden una sola vez. Como cada descarga pasa por get_json,
+    la caché y el manejo de errores se aplican igual que en las llamadas sueltas.
+    No usa asyncio, así que también sirve dentro de un event loop (Jupyter, código async).
+    """
+    unique = list(dict.fromkeys(urls))
+    with tqdm(total=len(unique), desc=desc, disable=desc is None or not PROGRESS) as bar:
+        if len(unique) <= 1 or threading.current_thread().name.startswith(_POOL_PREFIX):
+            # Una sola URL no necesita hilos, y desde un hilo del pool esperar al mismo pool
+            # podría bloquearse: en ambos casos se descarga aquí mismo
+            fetched = map(get_json, unique)
+        else:
+            # copy_context lleva la prioridad (interactive()) al hilo que hace la petición
+            fetched = _pool(concurrency or CONCURRENCY).map(
+                lambda url, ctx: ctx.run(get_json, url), unique, [contextvars.copy_context() for _ in unique]
+            )
+        results = {}
+        for url, data in zip(unique, fetched):
+            results[url] = data
+            bar.update(1)
+    return [results[u] for u in urls]
+
+async def fetch_many_async(urls, concurrency=None, desc=None):
+    """fetch_many para código async: corre en un hilo aparte sin bloquear el event loop"""
+    return await asyncio.to_thread(fetch_many, urls, concurrency, desc)
+
+def pokemon_url(name_or_id):
+    return f"{BASE_URL}/pokemon/{name_or_id}"
+
+def species_url(name_or_id):
+    return f"{BASE_URL}/pokemon-species/{name_or_id}"
+
+def id_from_url(url):
+    """Extrae el id numérico con el que termina una URL de recurso de la PokeAPI"""
+    return int(url.rstrip("/").rsplit("/", 1)[-1])
+
+def get_pokemon_ids_by_type(tipo):
+    """Devuelve pares (nombre, id) de un tipo; el id sale de la URL del listado, sin pedir detalles"""
     data = get_json(f"{BASE_URL}/type/{tipo}")
-    return [p['pokemon']['name'] for p in data['pokemon']] if data else []
+    return [(p['pokemon']['name'], id_from_url(p['pokemon']['url'])) for p in data['pokemon']] if data else []
+
+def get_pokemon_by_type(tipo, ids=None):
+    """Devuelve lista de pokémon de un tipo específico, opcionalmente solo los de ids (p. ej. KANTO)"""
+    return [name for name, pid in get_pokemon_ids_by_type(tipo) if ids is None or pid in ids]
 
 def get_pokemon_info(name_or_id):
     """Obtiene detalles de un pokémon por nombre o id"""
-    return get_json(f"{BASE_URL}/pokemon/{name_or_id}")
+    return get_json(pokemon_url(name_or_id))
 
 def get_species_info(name_or_id):
     """Obtiene detalles de species (hábitat, evolución, etc.)"""
-    return get_json(f"{BASE_URL}/pokemon-species/{name_or_id}")
+    return get_json(species_url(name_or_id))
 
 def get_evolution_chain(chain_url):
     """Obtiene la cadena evolutiva a partir de species"""
     return get_json(chain_url)
 
+# ------------------------------
+# 🔹 Snapshot local (Pokédex columnar)
+# ------------------------------
+
+def build_snapshot(path=SNAPSHOT_PATH, limit=100000):
+    """Descarga una vez todos los Pokémon y sus species y guarda las columnas en un .npz"""
+    listing = get_json(f"{BASE_URL}/pokemon?limit={limit}")
+    if not listing:
+        return None
+    ids = [id_from_url(e["url"]) for e in listing["results"]]
+    infos = [i for i in fetch_many([pokemon_url(i) for i in ids], desc="Snapshot: pokémon") if i]
+    infos.sort(key=lambda i: i["id"])
+    species_ids = sorted({id_from_url(i["species"]["url"]) for i in infos})
+    species = dict(zip(species_ids, fetch_many([species_url(i) for i in species_ids],
+                                               desc="Snapshot: species")))
+
+    def tipo(info, slot):
+        return next((t["type"]["name"] for t in info["types"] if t["slot"] == slot), "")
+
+    def stats(info):
+        base = {s["stat"]["name"]: s["base_stat"] for s in info["stats"]}
+        return [base.get(name, 0) for name in STAT_NAMES]
+
+    sp = [species.get(id_from_url(i["species"]["url"])) or {} for i in infos]
+    np.savez_compressed(
+        path,
+        id=np.array([i["id"] for i in infos], dtype=np.int32),
+        name=np.array([i["name"] for i in infos], dtype=str),
+        species=np.array([i["species"]["name"] for i in infos], dtype=str),
+        type1=np.array([tipo(i, 1) for i in infos], dtype=str),
+        type2=np.array([tipo(i, 2) for i in infos], dtype=str),
+        height=np.array([i["height"] for i in infos], dtype=np.int32),
+        weight=np.array([i["weight"] for i in infos], dtype=np.int32),
+        stats=np.array([stats(i) for i in infos], dtype=np.int16).reshape(-1, len(STAT_NAMES)),
+        is_legendary=np.array([bool(s.get("is_legendary")) for s in sp]),
+        is_mythical=np.array([bool(s.get("is_mythical")) for s in sp]),
+        habitat=np.array([(s.get("habitat") or {}).get("name", "") for s in sp], dtype=str),
+        evolves_from=np.array([(s.get("evolves_from_species") or {}).get("name", "") for s in sp], dtype=str),
+        evolution_chain_id=np.array([id_from_url(s["evolution_chain"]["url"]) if s.get("evolution_chain") else 0
+                                     for s in sp], dtype=np.int32),
+    )
+    return len(infos)
+
+
+class Pokedex:
+    """Snapshot de la Pokédex en columnas NumPy, consultable sin red.
+
+    Cada fila es un Pokémon (incluidas las formas alternativas, id > 10000)
+    ordenado por id, con los datos de su species ya unidos.
+    """
+
+    def __init__(self, path=SNAPSHOT_PATH):
+        with np.load(path, allow_pickle=False) as data:
+            for key in data.files:
+                setattr(self, key, data[key])
+
+    def type_mask(self, tipo):
+        return (self.type1 == tipo) | (self.type2 == tipo)
+
+    def id_mask(self, start, stop):
+        return (self.id >= start) & (self.id < stop)
+
+    def stat(self, name):
+        return self.stats[:, STAT_NAMES.index(name)]
+
+    def has_species_name(self):
+        """Filas cuyo nombre también es el de su species (lo que /pokemon-species/{name} resuelve)"""
+        return self.name == self.species
+
+    def chain_sizes(self):
+        """Número de species distintas en la cadena evolutiva de cada fila"""
+        _, first = np.unique(self.species, return_index=True)
+        chains, counts = np.unique(self.evolution_chain_id[first], return_counts=True)
+        return counts[np.searchsorted(chains, self.evolution_chain_id)]
+
+    def evolution_chain(self, species):
+        """Cadena completa de species (en profundidad desde la raíz), armada con evolves_from"""
+        rows = np.flatnonzero(self.species == species)
+        if rows.size == 0:
+            return []
+        idx = np.flatnonzero(self.evolution_chain_id == self.evolution_chain_id[rows[0]])
+        # Una fila por species, en orden de id (el de la API para las ramas)
+        idx = np.sort(idx[np.unique(self.species[idx], return_index=True)[1]])
+        parent = {str(self.species[i]): str(self.evolves_from[i]) for i in idx}
+        children = defaultdict(list)
+        for name, padre in parent.items():
+            if padre:
+                children[padre].append(name)
+
+        raiz = species
+        while parent.get(raiz):
+            raiz = parent[raiz]
+        chain = []
+
+        def recorrer(name):
+            chain.append(name)
+            for hijo in children[name]:
+                recorrer(hijo)
+
+        recorrer(raiz)
+        return chain
+
+    def best(self, values, mask, lowest=False, default=("", 0)):
+        """(nombre, valor) con el máximo (o mínimo) de values dentro de mask; gana el de menor id"""
+        idx = np.flatnonzero(mask)
+        if idx.size == 0:
+            return default
+        pos = idx[np.argmin(values[idx]) if lowest else np.argmax(values[idx])]
+        return (str(self.name[pos]), int(values[pos]))
+
+
+# Si se carga un snapshot (load_snapshot o --offline), las consultas lo usan en vez de la red
+POKEDEX = None
+
+def load_snapshot(path=SNAPSHOT_PATH):
+    global POKEDEX
+    POKEDEX = Pokedex(path)
+    return POKEDEX
+
 # ------------------------------
 # 🔹 Clasificación por Tipos
 # ------------------------------
 
+@instrumentado
 def fuego_kanto():
     """a) ¿Cuántos Pokémon de tipo fuego existen en Kanto?"""
-    pokes = get_pokemon_by_type("fire")
-    kanto = []
-    for p in tqdm(pokes, desc="Revisando Kanto"):
-        info = get_pokemon_info(p)
-        if info and info['id'] <= 151:  # Kanto son #1 a #151
-            kanto.append(info['name'])
-    return kanto
+    if POKEDEX is not None:
+        mask = POKEDEX.type_mask("fire") & POKEDEX.id_mask(KANTO.start, KANTO.stop)
+        return [str(n) for n in POKEDEX.name[mask]]
+    # Kanto son #1 a #151: el id del listado basta, no hace falta pedir cada pokémon
+    return get_pokemon_by_type("fire", KANTO)
 
+@instrumentado
 def agua_altos():
     """b) Pokémon tipo agua con altura > 10"""
+    if POKEDEX is not None:
+        mask = POKEDEX.type_mask("water") & (POKEDEX.height > 10)
+        return [(str(n), int(h)) for n, h in zip(POKEDEX.name[mask], POKEDEX.height[mask])]
     pokes = get_pokemon_by_type("water")
-    grandes = []
-    for p in tqdm(pokes, desc="Buscando Pokémon altos"):
-        info = get_pokemon_info(p)
-        if info and info['height'] > 10:
-            grandes.append((info['name'], info['height']))
-    return grandes
+    return altos(fetch_many([pokemon_url(p) for p in pokes], desc="Buscando Pokémon altos"))
+
+def altos(infos, altura=10):
+    """(nombre, altura) de los pokémon con altura mayor a la dada"""
+    return [(info['name'], info['height']) for info in infos if info and info['height'] > altura]
 
 # ------------------------------
 # 🔹 Evoluciones
 # ------------------------------
 
-def cadena_evolutiva(pokemon):
-    """a) Cadena evolutiva completa de un pokémon inicial"""
-    species = get_species_info(pokemon)
-    if not species: return []
-    evo_chain = get_evolution_chain(species['evolution_chain']['url'])
-    chain = []
+class EvolutionIndex:
+    """Índice en memoria de cadenas evolutivas, aplanadas en mapas padre/hijos.
+
+    Cada cadena se descarga una sola vez (por id de cadena) aunque la compartan
+    varias species; con load_all() se cargan todas y ya no hace falta pedir species.
+    """
+
+    def __init__(self):
+        self.chain_ids = set()
+        self.parent = {}    # species -> species de la que evoluciona (None si es la raíz)
+        self.children = {}  # species -> species en las que evoluciona, en el orden de la API
+        self.complete = False
+
+    def add(self, chain):
+        """Aplana un documento /evolution-chain/{id} en los mapas del índice"""
+        def recorrer(evo, padre):
+            name = evo['species']['name']
+            self.parent[name] = padre
+            self.children[name] = []
+            if padre:
+                self.children[padre].append(name)
+            for e in evo['evolves_to']:
+                recorrer(e, name)
+
+        recorrer(chain['chain'], None)
+        self.chain_ids.add(chain['id'])
+
+    def ensure(self, chain_urls):
+        """Descarga en paralelo solo las cadenas que todavía no están en el índice"""
+        pending = [u for u in dict.fromkeys(chain_urls) if id_from_url(u) not in self.chain_ids]
+        for chain in fetch_many(pending, desc="Cadenas evolutivas" if len(pending) > 1 else None):
+            if chain:
+                self.add(chain)
 
-    def recorrer(evo):
-        chain.append(evo['species']['name'])
-        for e in evo['evolves_to']:
-            recorrer(e)
+    def load_all(self):
+        """Carga todas las cadenas de la API: O(cadenas) peticiones en vez de O(species)"""
+        listing = get_json(f"{BASE_URL}/evolution-chain?limit=100000")
+        if listing:
+            self.ensure([c['url'] for c in listing['results']])
+            self.complete = True
+        return self
 
-    recorrer(evo_chain['chain'])
-    return chain
+    def __contains__(self, species):
+        return species in self.parent
 
+    def root(self, species):
+        while self.parent[species]:
+            species = self.parent[species]
+        return species
+
+    def full_chain(self, species):
+        """Cadena completa (recorrido en profundidad desde la raíz) a la que pertenece species"""
+        if species not in self:
+            return []
+        chain = []
+
+        def recorrer(name):
+            chain.append(name)
+            for hijo in self.children[name]:
+                recorrer(hijo)
+
+        recorrer(self.root(species))
+        return chain
+
+    def has_evolutions(self, species):
+        """True si species forma parte de una cadena con más de un miembro"""
+        return bool(self.children[self.root(species)])
+
+    def without_evolutions(self):
+        """Todas las species cargadas que no evolucionan ni provienen de otra"""
+        return [name for name, padre in self.parent.items() if padre is None and not self.children[name]]
+
+
+# Índice compartido por las consultas de evoluciones
+EVOLUCIONES = EvolutionIndex()
+
+@instrumentado
+def cadena_evolutiva(pokemon):
+    """a) Cadena evolutiva completa de un pokémon inicial"""
+    if POKEDEX is not None:
+        return POKEDEX.evolution_chain(pokemon)
+    if EVOLUCIONES.complete and pokemon in EVOLUCIONES:
+        return EVOLUCIONES.full_chain(pokemon)
+    # Consulta puntual: pasa delante de los recorridos masivos en el scheduler
+    with interactive():
+        species = get_species_info(pokemon)
+        if not species: return []
+        EVOLUCIONES.ensure([species['evolution_chain']['url']])
+    return EVOLUCIONES.full_chain(species['name'])
+
+@instrumentado
 def electricos_sin_evo():
     """b) Pokémon eléctricos que no tienen evoluciones"""
+    if POKEDEX is not None:
+        mask = (POKEDEX.type_mask("electric") & POKEDEX.has_species_name()
+                & (POKEDEX.evolves_from == "") & (POKEDEX.chain_sizes() == 1))
+        return [str(n) for n in POKEDEX.name[mask]]
     pokes = get_pokemon_by_type("electric")
-    solitarios = []
-    for p in tqdm(pokes, desc="Buscando eléctricos sin evolución"):
-        species = get_species_info(p)
-        if species and species['evolves_from_species'] is None:
-            evo_chain = get_evolution_chain(species['evolution_chain']['url'])
-            if evo_chain and len(evo_chain['chain']['evolves_to']) == 0:
-                solitarios.append(species['name'])
-    return solitarios
+    if EVOLUCIONES.complete:
+        # Con todas las cadenas en memoria no hace falta pedir ninguna species
+        return [p for p in pokes if p in EVOLUCIONES and not EVOLUCIONES.has_evolutions(p)]
+    return sin_evolucion(fetch_many([species_url(p) for p in pokes], desc="Buscando eléctricos sin evolución"))
+
+def sin_evolucion(species_list):
+    """Nombres de las species (en orden) que no evolucionan ni provienen de otra"""
+    candidatos = [s for s in species_list if s and s['evolves_from_species'] is None]
+    EVOLUCIONES.ensure([s['evolution_chain']['url'] for s in candidatos])
+    return [s['name'] for s in candidatos
+            if s['name'] in EVOLUCIONES and not EVOLUCIONES.has_evolutions(s['name'])]
 
 # ------------------------------
 # 🔹 Estadísticas de Batalla
 # ------------------------------
 
+@instrumentado
 def max_attack_johto():
     """a) Pokémon con mayor ataque base en Johto (#152-#251)"""
-    max_atk = ("", 0)
-    for i in tqdm(range(152, 252), desc="Johto Pokémon"):
-        info = get_pokemon_info(i)
-        if info:
-            atk = next(stat['base_stat'] for stat in info['stats'] if stat['stat']['name'] == 'attack')
-            if atk > max_atk[1]:
-                max_atk = (info['name'], atk)
-    return max_atk
+    if POKEDEX is not None:
+        return POKEDEX.best(POKEDEX.stat("attack"), POKEDEX.id_mask(JOHTO.start, JOHTO.stop))
+    return max_stat(fetch_many([pokemon_url(i) for i in JOHTO], desc="Johto Pokémon"), 'attack')
 
+@instrumentado
 def fastest_non_legendary(limit=1025):
     """b) Pokémon con mayor velocidad que no sea legendario"""
-    max_speed = ("", 0)
-    for i in tqdm(range(1, limit), desc="Buscando velocistas"):
-        species = get_species_info(i)
-        if not species: continue
-        if species['is_legendary'] or species['is_mythical']:
-            continue
-        info = get_pokemon_info(i)
+    if POKEDEX is not None:
+        mask = POKEDEX.id_mask(1, limit) & ~POKEDEX.is_legendary & ~POKEDEX.is_mythical
+        return POKEDEX.best(POKEDEX.stat("speed"), mask)
+    species_list = fetch_many([species_url(i) for i in range(1, limit)], desc="Buscando velocistas")
+    # Solo se descargan los detalles de los que no son legendarios ni míticos
+    ids = no_legendarios(range(1, limit), species_list)
+    return max_stat(fetch_many([pokemon_url(i) for i in ids]), 'speed')
+
+def no_legendarios(ids, species_list):
+    """Ids cuya species existe y no es legendaria ni mítica"""
+    return [i for i, species in zip(ids, species_list)
+            if species and not (species['is_legendary'] or species['is_mythical'])]
+
+def max_stat(infos, stat_name):
+    """(nombre, valor) del pokémon con el mayor stat base; en empate gana el primero"""
+    mejor = ("", 0)
+    for info in infos:
         if info:
-            speed = next(stat['base_stat'] for stat in info['stats'] if stat['stat']['name'] == 'speed')
-            if speed > max_speed[1]:
-                max_speed = (info['name'], speed)
-    return max_speed
+            valor = next(stat['base_stat'] for stat in info['stats'] if stat['stat']['name'] == stat_name)
+            if valor > mejor[1]:
+                mejor = (info['name'], valor)
+    return mejor
 
 # ------------------------------
 # 🔹 Extras
 # ------------------------------
 
+@instrumentado
 def habitat_planta():
     """a) Hábitat más común entre Pokémon planta"""
+    if POKEDEX is not None:
+        mask = POKEDEX.type_mask("grass") & POKEDEX.has_species_name() & (POKEDEX.habitat != "")
+        habs, first, counts = np.unique(POKEDEX.habitat[mask], return_index=True, return_counts=True)
+        if habs.size == 0:
+            return ("", 0)
+        # En empate gana el hábitat que apareció primero, igual que con el dict
+        best = min(np.flatnonzero(counts == counts.max()), key=lambda k: first[k])
+        return (str(habs[best]), int(counts[best]))
     pokes = get_pokemon_by_type("grass")
+    return habitat_mas_comun(fetch_many([species_url(p) for p in pokes], desc="Analizando hábitats planta"))
+
+def habitat_mas_comun(species_list):
+    """(hábitat, cantidad) más frecuente entre las species dadas; ("", 0) si ninguna tiene hábitat"""
     habitats = {}
-    for p in tqdm(pokes, desc="Analizando hábitats planta"):
-        species = get_species_info(p)
+    for species in species_list:
         if species and species['habitat']:
             hab = species['habitat']['name']
             habitats[hab] = habitats.get(hab, 0) + 1
-    return max(habitats.items(), key=lambda x: x[1])
+    return max(habitats.items(), key=lambda x: x[1], default=("", 0))
 
+@instrumentado
 def menor_peso(limit=1025):
     """b) Pokémon con menor peso en toda la API"""
+    if POKEDEX is not None:
+        return POKEDEX.best(POKEDEX.weight, POKEDEX.id_mask(1, limit), lowest=True, default=("", 999999))
+    return mas_liviano(fetch_many([pokemon_url(i) for i in range(1, limit)], desc="Buscando Pokémon liviano"))
+
+def mas_liviano(infos):
+    """(nombre, peso) del pokémon más liviano; en empate gana el primero"""
     min_peso = ("", 999999)
-    for i in tqdm(range(1, limit), desc="Buscando Pokémon liviano"):
-        info = get_pokemon_info(i)
+    for info in infos:
         if info and info['weight'] < min_peso[1]:
             min_peso = (info['name'], info['weight'])
     return min_peso
 
+# ------------------------------
+# 🔹 Todas las consultas en una pasada
+# ------------------------------
+
+CONSULTAS = {
+    "fuego_kanto": "🔥 Fuego en Kanto",
+    "agua_altos": "💧 Agua altura > 10",
+    "cadena_evolutiva": "🌱 Cadena evolutiva",
+    "electricos_sin_evo": "⚡ Eléctricos sin evolución",
+    "max_attack_johto": "🛡️ Mayor ataque en Johto",
+    "fastest_non_legendary": "💨 Más veloz no legendario",
+    "habitat_planta": "🌍 Hábitat común planta",
+    "menor_peso": "⚖️ Pokémon más liviano",
+}
+
+# Consultas que parten del listado de un tipo
+TIPOS_CONSULTA = {
+    "fuego_kanto": "fire",
+    "agua_altos": "water",
+    "electricos_sin_evo": "electric",
+    "habitat_planta": "grass",
+}
+
+@instrumentado
+def run_analyses(selected=None, limit=1025, inicial="bulbasaur"):
+    """Responde varias consultas con una sola pasada sobre los Pokémon y species.
+
+    Primero se reúnen los ids que necesita cada consulta, después se descarga cada
+    /pokemon-species/{id} y /pokemon/{id} una sola vez y al final se calculan todos
+    los agregados sobre esos documentos. Devuelve {consulta: resultado} en el orden pedido.
+    """
+    selected = [q for q in CONSULTAS if q in (selected or CONSULTAS)]
+    if POKEDEX is not None:
+        # Con snapshot cada consulta ya es instantánea y no usa la red
+        return {q: run_single(q, limit, inicial) for q in selected}
+
+    listados = {q: get_pokemon_ids_by_type(t) for q, t in TIPOS_CONSULTA.items() if q in selected}
+    rango = range(1, limit)
+
+    species_ids = set()
+    if "fastest_non_legendary" in selected:
+        species_ids.update(rango)
+    for q in ("electricos_sin_evo", "habitat_planta"):
+        if q in selected:
+            species_ids.update(pid for _, pid in listados[q])
+    species_ids = sorted(species_ids)
+    species = dict(zip(species_ids, fetch_many([species_url(i) for i in species_ids], desc="Species")))
+
+    rapidos = no_legendarios(rango, [species[i] for i in rango]) if "fastest_non_legendary" in selected else []
+    pokemon_ids = set(rapidos)
+    if "agua_altos" in selected:
+        pokemon_ids.update(pid for _, pid in listados["agua_altos"])
+    if "max_attack_johto" in selected:
+        pokemon_ids.update(JOHTO)
+    if "menor_peso" in selected:
+        pokemon_ids.update(rango)
+    pokemon_ids = sorted(pokemon_ids)
+    pokemon = dict(zip(pokemon_ids, fetch_many([pokemon_url(i) for i in pokemon_ids], desc="Pokémon")))
+
+    def species_por_nombre(listado):
+        # /pokemon-species/{name} solo resuelve si el nombre del pokémon es el de su species
+        return [species[pid] if species[pid] and species[pid]['name'] == name else None
+                for name, pid in listado]
+
+    resultados = {}
+    for q in selected:
+        if q == "fuego_kanto":
+            resultados[q] = [name for name, pid in listados[q] if pid in KANTO]
+        elif q == "agua_altos":
+            resultados[q] = altos(pokemon[pid] for _, pid in listados[q])
+        elif q == "cadena_evolutiva":
+            # Si la pasada ya trajo la species de inicial (por id), no se vuelve a pedir por nombre
+            sp = next((s for s in species.values() if s and s['name'] == inicial), None)
+            if sp:
+                EVOLUCIONES.ensure([sp['evolution_chain']['url']])
+                resultados[q] = EVOLUCIONES.full_chain(sp['name'])
+            else:
+                resultados[q] = cadena_evolutiva(inicial)
+        elif q == "electricos_sin_evo":
+            resultados[q] = sin_evolucion(species_por_nombre(listados[q]))
+        elif q == "max_attack_johto":
+            resultados[q] = max_stat((pokemon[i] for i in JOHTO), 'attack')
+        elif q == "fastest_non_legendary":
+            resultados[q] = max_stat((pokemon[i] for i in rapidos), 'speed')
+        elif q == "habitat_planta":
+            resultados[q] = habitat_mas_comun(species_por_nombre(listados[q]))
+        elif q == "menor_peso":
+            resultados[q] = mas_liviano(pokemon[i] for i in rango)
+    return resultados
+
+def run_single(consulta, limit=1025, inicial="bulbasaur"):
+    """Ejecuta una consulta por separado con sus parámetros"""
+    if consulta == "cadena_evolutiva":
+        return cadena_evolutiva(inicial)
+    if consulta in ("fastest_non_legendary", "menor_peso"):
+        return globals()[consulta](limit)
+    return globals()[consulta]()
+
 # ------------------------------
 # 🚀 Pruebas
 # ------------------------------
 if __name__ == "__main__":
-    print("🔥 Fuego en Kanto:", fuego_kanto())
-    print("💧 Agua altura > 10:", agua_altos())
-    print("🌱 Cadena evolutiva de bulbasaur:", cadena_evolutiva("bulbasaur"))
-    print("⚡ Eléctricos sin evolución:", electricos_sin_evo())
-    print("🛡️ Mayor ataque en Johto:", max_attack_johto())
-    print("💨 Más veloz no legendario:", fastest_non_legendary(500))  # limitado por rapidez
-    print("🌍 Hábitat común planta:", habitat_planta())
-    print("⚖️ Pokémon más liviano:", menor_peso(500))  # limitado por rapidez
+    parser = argparse.ArgumentParser(description="Consultas avanzadas con la PokeAPI")
+    parser.add_argument("comando", nargs="?", choices=["consultas", "snapshot"], default="consultas",
+                        help="'snapshot' descarga la Pokédex completa a un .npz local")
+    parser.add_argument("--snapshot", default=SNAPSHOT_PATH, help="Ruta del archivo .npz")
+    parser.add_argument("--offline", action="store_true", help="Responder desde el snapshot, sin red")
+    parser.add_argument("--solo", nargs="+", choices=list(CONSULTAS), help="Consultas a ejecutar (por defecto todas)")
+    parser.add_argument("--limit", type=int, default=500, help="Último id (excluido) en los recorridos por id")
+    args = parser.parse_args()
+
+    if args.comando == "snapshot":
+        total = build_snapshot(args.snapshot)
+        if total is None:
+            raise SystemExit("No se pudo descargar el listado de Pokémon")
+        print(f"💾 Snapshot guardado en {args.snapshot}: {total} Pokémon")
+        raise SystemExit(0)
+    if args.offline:
+        load_snapshot(args.snapshot)
+
+    # Una sola pasada: cada pokémon/species se descarga una vez aunque lo usen varias consultas
+    for consulta, resultado in run_analyses(args.solo, limit=args.limit).items():
+        print(f"{CONSULTAS[consulta]}:", resultado)
+    if CACHE:
+        CACHE.report()
@@ -0,0 +1,145 @@
+import os
+import time
+import threading
+
+# Sin barras, resúmenes ni caché del usuario: cada prueba arma su entorno
+os.environ["POKE_PROGRESS"] = "0"
+os.environ["POKE_METRICS"] = "0"
+os.environ["POKECACHE_PATH"] = ""
+
+import pytest
+import pokecode
+from fixture_server import FixtureServer, synthetic_fixtures
+
+LIMIT = 30
+
+
+@pytest.fixture(scope="module")
+def server():
+    server = FixtureServer(synthetic_fixtures(n_pokemon=260, n_forms=5))
+    server.start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture(autouse=True)
+def pokeapi(server, tmp_path, monkeypatch):
+    """pokecode apuntando al servidor local, con caché propia y sin límite de ritmo"""
+    server.error_rate = server.throttle_rate = 0.0
+    server.reset_counts()
+    monkeypatch.setattr(pokecode, "BASE_URL", server.base_url)
+    monkeypatch.setattr(pokecode, "CACHE", pokecode.ResponseCache(str(tmp_path / "cache.sqlite")))
+    monkeypatch.setattr(pokecode, "SCHEDULER", None)
+    monkeypatch.setattr(pokecode, "EVOLUCIONES", pokecode.EvolutionIndex())
+    monkeypatch.setattr(pokecode, "BACKOFF_BASE", 0.001)
+    cache = pokecode.CACHE
+    yield
+    cache.conn.close()
+
+
+def test_warm_run_makes_no_requests(server):
+    cold = pokecode.run_analyses(limit=LIMIT)
+    assert server.counts["total"] > 0
+
+    server.reset_counts()
+    pokecode.EVOLUCIONES = pokecode.EvolutionIndex()
+    assert pokecode.run_analyses(limit=LIMIT) == cold
+    assert server.counts["total"] == 0
+    assert pokecode.CACHE.stats["hits"] > 0
+
+
+def test_stale_entry_is_revalidated_with_304(server, monkeypatch):
+    url = pokecode.pokemon_url(1)
+    fresh = pokecode.get_json(url)
+    assert pokecode.CACHE.stats["misses"] == 1
+
+    monkeypatch.setattr(pokecode.CACHE, "ttl", 0)
+    assert pokecode.get_json(url) == fresh
+    assert pokecode.CACHE.stats["revalidated"] == 1
+    assert pokecode.CACHE.stats["misses"] == 1
+    assert server.counts["pokemon"] == 2
+    # El 304 renueva la entrada: con el TTL normal vuelve a servirse sin red
+    monkeypatch.setattr(pokecode.CACHE, "ttl", 3600)
+    assert pokecode.get_json(url) == fresh
+    assert server.counts["pokemon"] == 2
+
+
+def test_server_errors_are_retried(server, monkeypatch):
+    monkeypatch.setattr(pokecode, "MAX_RETRIES", 10)
+    server.error_rate = 0.3
+    urls = [pokecode.pokemon_url(i) for i in range(1, LIMIT)]
+    infos = pokecode.fetch_many(urls)
+    assert [info["id"] for info in infos] == list(range(1, LIMIT))
+    # Los 503 se reintentaron: llegaron más peticiones que URLs
+    assert server.counts["pokemon"] > len(urls)
+
+
+def test_connection_pool_grows_with_concurrency(monkeypatch):
+    monkeypatch.setattr(pokecode, "SESSION", pokecode.build_session(2))
+    urls = [pokecode.pokemon_url(i) for i in range(1, LIMIT)]
+    assert all(pokecode.fetch_many(urls, concurrency=8))
+    assert pokecode.SESSION.pool_size == 8
+    assert pokecode.SESSION.get_adapter(urls[0]).poolmanager.connection_pool_kw["maxsize"] == 8
+
+
+def test_offline_battery_does_not_touch_the_network(server, tmp_path, monkeypatch):
+    online = pokecode.run_analyses(limit=LIMIT)
+    assert pokecode.build_snapshot(str(tmp_path / "pokedex.npz"))
+
+    monkeypatch.setattr(pokecode, "POKEDEX", None)
+    pokecode.load_snapshot(str(tmp_path / "pokedex.npz"))
+    # Un puerto cerrado: cualquier petición fallaría
+    monkeypatch.setattr(pokecode, "BASE_URL", "http://127.0.0.1:9/api/v2")
+    monkeypatch.setattr(pokecode, "MAX_RETRIES", 0)
+    monkeypatch.setattr(pokecode, "CACHE", None)
+    monkeypatch.setattr(pokecode, "EVOLUCIONES", pokecode.EvolutionIndex())
+    offline = pokecode.run_analyses(limit=LIMIT)
+    assert offline["cadena_evolutiva"] == online["cadena_evolutiva"] != []
+    assert offline == online
+    assert pokecode.POKEDEX.evolution_chain("no-existe") == []
+
+
+def test_single_pass_fetches_each_species_once(server, monkeypatch):
+    resultados = pokecode.run_analyses(["cadena_evolutiva", "fastest_non_legendary"], limit=LIMIT)
+    assert resultados["cadena_evolutiva"] == pokecode.cadena_evolutiva("bulbasaur")
+    server.reset_counts()
+    monkeypatch.setattr(pokecode, "CACHE", None)
+    monkeypatch.setattr(pokecode, "EVOLUCIONES", pokecode.EvolutionIndex())
+    pokecode.run_analyses(["cadena_evolutiva", "fastest_non_legendary"], limit=LIMIT)
+    # bulbasaur es /pokemon-species/1: sale de la pasada, sin pedirlo otra vez por nombre
+    assert server.counts["pokemon-species"] == LIMIT - 1
+
+
+def test_429_halves_the_scheduler_rate(server, monkeypatch):
+    scheduler = pokecode.RequestScheduler(rate=40, burst=4)
+    monkeypatch.setattr(pokecode, "SCHEDULER", scheduler)
+    monkeypatch.setattr(pokecode, "MAX_RETRIES", 1)
+    monkeypatch.setattr(pokecode, "BACKOFF_MAX", 0.01)  # acota la pausa del Retry-After
+    server.throttle_rate = 1.0
+    assert pokecode.get_json(pokecode.pokemon_url(1)) is None
+    assert server.counts["pokemon"] == 2
+    assert scheduler.rate == 20
+
+    # Las respuestas correctas devuelven el ritmo al máximo poco a poco
+    server.throttle_rate = 0.0
+    pokecode.get_json(pokecode.pokemon_url(2))
+    assert 20 < scheduler.rate < 40
+
+
+def test_interactive_requests_go_first():
+    scheduler = pokecode.RequestScheduler(rate=10, burst=1)
+    scheduler.acquire()  # sin tokens: el próximo llega en 0.1 s
+    orden = []
+
+    def pedir(nombre, interactivo):
+        scheduler.acquire(interactivo)
+        orden.append(nombre)
+
+    masiva = threading.Thread(target=pedir, args=("masiva", False))
+    masiva.start()
+    time.sleep(0.02)  # la masiva ya está esperando cuando llega la interactiva
+    interactiva = threading.Thread(target=pedir, args=("interactiva", True))
+    interactiva.start()
+    masiva.join()
+    interactiva.join()
+    assert orden == ["interactiva", "masiva"]
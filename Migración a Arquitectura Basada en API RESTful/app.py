@@ -1,12 +1,111 @@
-import os, uuid
-from flask import Flask, request, jsonify
+import os, uuid, json, base64, binascii, hashlib
+from flask import Flask, request, jsonify, url_for
 from dotenv import load_dotenv
+from marshmallow import ValidationError
+from sqlalchemy import select, tuple_, insert, update, delete, bindparam, inspect, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm.exc import StaleDataError
 from db import db
-from models import Book
-from schemas import book_schema, books_schema
+from models import Book, ChangeCounter
+from schemas import BookSchema, book_schema, books_schema
+from search import setup_search, search_books, search_supported, rebuild_search_index, vacuum
 
 load_dotenv()
 
+# Tamaño máximo de página en GET /books?limit=
+MAX_PAGE_SIZE = int(os.getenv("BOOKS_MAX_PAGE_SIZE", "500"))
+BOOK_FIELDS = ["id", "title", "author", "genre", "status", "created_at"]
+# Máximo de libros por petición en /books/bulk
+MAX_BULK_ITEMS = int(os.getenv("BOOKS_MAX_BULK", "100000"))
+# Ids por sentencia IN (...) (SQLite limita los parámetros por consulta)
+ID_CHUNK = 500
+
+
+def encode_cursor(title, book_id):
+    """Cursor opaco con la posición (title, id) del último libro de la página"""
+    raw = json.dumps([title, book_id], ensure_ascii=False).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def clean_book_fields(data):
+    """Mismo saneamiento que POST /books: recorta textos y guarda el género vacío como None"""
+    out = dict(data)
+    for key in ("title", "author"):
+        if key in out:
+            out[key] = out[key].strip()
+    if "genre" in out:
+        out["genre"] = (out["genre"] or "").strip() or None
+    return out
+
+
+def existing_ids(ids):
+    found = set()
+    for i in range(0, len(ids), ID_CHUNK):
+        chunk = ids[i:i + ID_CHUNK]
+        found.update(db.session.execute(select(Book.id).where(Book.id.in_(chunk))).scalars())
+    return found
+
+
+def bulk_items(json_data, key):
+    """Lista del cuerpo (o de json_data[key]) validada en tamaño; devuelve (items, error)"""
+    items = json_data.get(key) if isinstance(json_data, dict) else json_data
+    if not isinstance(items, list) or not items:
+        return None, ({"error": f"se espera una lista no vacía (o {{\"{key}\": [...]}})"}, 400)
+    if len(items) > MAX_BULK_ITEMS:
+        return None, ({"error": f"máximo {MAX_BULK_ITEMS} elementos por petición"}, 413)
+    return items, None
+
+
+def item_errors(errors):
+    """{índice: mensajes} -> reporte por elemento, ordenado por índice"""
+    return [{"index": i, "errors": errors[i]} for i in sorted(errors)]
+
+
+def touch_books():
+    """Sube el contador de la colección; llamar en cada escritura, antes del commit"""
+    db.session.execute(
+        update(ChangeCounter).where(ChangeCounter.name == "books").values(value=ChangeCounter.value + 1)
+    )
+
+
+def collection_etag():
+    """ETag de un listado: contador de cambios + la URL pedida (cada página/filtro es otra representación)"""
+    counter = db.session.execute(select(ChangeCounter.value).where(ChangeCounter.name == "books")).scalar_one()
+    return f"books-{counter}-{hashlib.sha1(request.full_path.encode()).hexdigest()[:12]}"
+
+
+def not_modified(etag):
+    return "", 304, {"ETag": f'"{etag}"'}
+
+
+def precondition_failed(book):
+    return {"error": "el libro cambió; vuelve a leerlo", "version": book.version}, 412, {"ETag": f'"{book.version}"'}
+
+
+def migrate():
+    """Agrega a bases existentes lo que create_all no crea en tablas que ya estaban"""
+    if "version" not in {c["name"] for c in inspect(db.engine).get_columns("books")}:
+        with db.engine.begin() as conn:
+            conn.execute(text("ALTER TABLE books ADD COLUMN version INTEGER NOT NULL DEFAULT 1"))
+    if db.session.get(ChangeCounter, "books") is None:
+        db.session.add(ChangeCounter(name="books", value=0))
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # Varios workers arrancando sobre una base nueva: otro ya creó la fila
+            db.session.rollback()
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        title, book_id = json.loads(raw)
+    except (binascii.Error, ValueError, TypeError):
+        raise ValueError("cursor inválido")
+    if not isinstance(title, str) or not isinstance(book_id, str):
+        raise ValueError("cursor inválido")
+    return title, book_id
+
 def create_app():
     app = Flask(__name__)
     app.config["SQLALCHEMY_DATABASE_URI"] = os.getenv("DATABASE_URL", "sqlite:///books.db")
@@ -15,24 +114,217 @@ def create_app():
     db.init_app(app)
     with app.app_context():
         db.create_all()
+        # create_all no agrega índices nuevos a tablas que ya existían
+        for index in Book.__table__.indexes:
+            index.create(db.engine, checkfirst=True)
+        migrate()
+        setup_search()
+
+    @app.cli.command("rebuild-search")
+    def rebuild_search_command():
+        """Reconstruye el índice de búsqueda (después de un VACUUM hecho a mano)"""
+        if not search_supported():
+            raise SystemExit("la búsqueda requiere SQLite con FTS5")
+        rebuild_search_index()
+        print("🔎 Índice de búsqueda reconstruido")
+
+    @app.cli.command("vacuum")
+    def vacuum_command():
+        """VACUUM de la base y reconstrucción del índice de búsqueda"""
+        vacuum()
+        print("🧹 Base compactada e índice de búsqueda reconstruido")
 
     @app.get("/health")
     def health():
         return {"status": "ok"}, 200
 
-    # GET /books
+    # GET /books  (?limit=&cursor= paginan por (title, id); ?fields= elige columnas)
     @app.get("/books")
     def list_books():
-        books = Book.query.order_by(Book.title.asc()).all()
-        return jsonify(books_schema.dump(books)), 200
+        # Un sondeo sin cambios se responde con una sola lectura del contador
+        etag = collection_etag()
+        if request.if_none_match.contains_weak(etag):
+            return not_modified(etag)
+
+        fields = request.args.get("fields")
+        if fields:
+            fields = [f.strip() for f in fields.split(",") if f.strip()]
+            unknown = [f for f in fields if f not in BOOK_FIELDS]
+            if unknown:
+                return {"error": f"campos desconocidos: {', '.join(unknown)}. Usa: {', '.join(BOOK_FIELDS)}"}, 400
+        else:
+            fields = BOOK_FIELDS
+
+        limit = request.args.get("limit")
+        cursor = request.args.get("cursor")
+        if limit is None and cursor is None:
+            # Sin paginar: el catálogo completo, como antes
+            page_size = None
+        else:
+            try:
+                page_size = int(limit) if limit is not None else MAX_PAGE_SIZE
+            except ValueError:
+                return {"error": "limit debe ser un entero"}, 400
+            if not 1 <= page_size <= MAX_PAGE_SIZE:
+                return {"error": f"limit debe estar entre 1 y {MAX_PAGE_SIZE}"}, 400
+
+        # Solo se leen las columnas pedidas (más title e id, que forman el cursor)
+        columns = [getattr(Book, f) for f in dict.fromkeys(["title", "id", *fields])]
+        query = select(*columns).order_by(Book.title.asc(), Book.id.asc())
+        if cursor:
+            try:
+                after = decode_cursor(cursor)
+            except ValueError as e:
+                return {"error": str(e)}, 400
+            # Keyset: usa el índice (title, id) y cuesta lo mismo en la página 1 que en la 10.000
+            query = query.where(tuple_(Book.title, Book.id) > after)
+        if page_size is not None:
+            query = query.limit(page_size + 1)
+        rows = db.session.execute(query).all()
+
+        headers = {}
+        if page_size is not None and len(rows) > page_size:
+            rows = rows[:page_size]
+            next_cursor = encode_cursor(rows[-1].title, rows[-1].id)
+            headers["X-Next-Cursor"] = next_cursor
+            args = {**request.args.to_dict(), "cursor": next_cursor, "limit": page_size}
+            headers["Link"] = f'<{url_for("list_books", _external=True, **args)}>; rel="next"'
+        schema = books_schema if fields == BOOK_FIELDS else BookSchema(many=True, only=fields)
+        headers["ETag"] = f'"{etag}"'
+        return jsonify(schema.dump(rows)), 200, headers
+
+    # ------------------------------
+    # Operaciones en lote: todo o nada, en una sola transacción.
+    # Si algún elemento no es válido no se escribe nada y la respuesta
+    # (400/404) detalla los errores de cada elemento por su índice.
+    # ------------------------------
+
+    # POST /books/bulk  [{title, author, genre?, status?}, ...]
+    @app.post("/books/bulk")
+    def create_books_bulk():
+        items, error = bulk_items(request.get_json(silent=True), "books")
+        if error:
+            return error
+        try:
+            data = BookSchema(many=True).load(items)
+        except ValidationError as e:
+            return {"error": "lote inválido", "items": item_errors(e.messages)}, 400
+
+        rows = [{"id": str(uuid.uuid4()), "status": "No leído", **clean_book_fields(d)} for d in data]
+        # Un solo INSERT ejecutado con executemany
+        db.session.execute(insert(Book), rows)
+        touch_books()
+        db.session.commit()
+        return {"created": len(rows), "items": [{"index": i, "id": r["id"]} for i, r in enumerate(rows)]}, 201
+
+    # PATCH /books/bulk  [{id, ...campos a cambiar}, ...]
+    @app.patch("/books/bulk")
+    def update_books_bulk():
+        items, error = bulk_items(request.get_json(silent=True), "books")
+        if error:
+            return error
+        schema = BookSchema(partial=True)
+        errors, rows = {}, []
+        for i, item in enumerate(items):
+            if not isinstance(item, dict) or not isinstance(item.get("id"), str):
+                errors[i] = {"id": ["requerido"]}
+                continue
+            changes = {k: v for k, v in item.items() if k != "id"}
+            try:
+                changes = schema.load(changes)
+            except ValidationError as e:
+                errors[i] = e.messages
+                continue
+            # load aplica load_default a status aunque no venga: solo se cambia lo enviado
+            changes = {k: v for k, v in changes.items() if k in item}
+            rows.append((i, {"id": item["id"], **clean_book_fields(changes)}))
+        if errors:
+            return {"error": "lote inválido", "items": item_errors(errors)}, 400
+
+        found = existing_ids([r["id"] for _, r in rows])
+        missing = {i: {"id": ["book not found"]} for i, r in rows if r["id"] not in found}
+        if missing:
+            return {"error": "hay libros que no existen", "items": item_errors(missing)}, 404
+
+        # UPDATE ... SET ..., version = version + 1 WHERE id = ? en executemany,
+        # una sentencia por cada combinación de columnas cambiadas
+        groups = {}
+        for _, r in rows:
+            if len(r) > 1:
+                groups.setdefault(tuple(sorted(k for k in r if k != "id")), []).append(r)
+        for keys, group in groups.items():
+            stmt = (
+                update(Book.__table__)
+                .where(Book.id == bindparam("b_id"))
+                .values({**{k: bindparam(f"b_{k}") for k in keys}, "version": Book.version + 1})
+            )
+            db.session.execute(stmt, [{f"b_{k}": v for k, v in r.items()} for r in group])
+        touch_books()
+        db.session.commit()
+        return {"updated": len(rows)}, 200
+
+    # DELETE /books/bulk  ["id", ...]  o  {"ids": [...]}
+    @app.delete("/books/bulk")
+    def delete_books_bulk():
+        ids, error = bulk_items(request.get_json(silent=True), "ids")
+        if error:
+            return error
+        errors = {i: {"id": ["se espera un id (texto)"]} for i, book_id in enumerate(ids) if not isinstance(book_id, str)}
+        if errors:
+            return {"error": "lote inválido", "items": item_errors(errors)}, 400
+        found = existing_ids(ids)
+        missing = {i: {"id": ["book not found"]} for i, book_id in enumerate(ids) if book_id not in found}
+        if missing:
+            return {"error": "hay libros que no existen", "items": item_errors(missing)}, 404
+
+        for i in range(0, len(ids), ID_CHUNK):
+            db.session.execute(delete(Book).where(Book.id.in_(ids[i:i + ID_CHUNK])))
+        touch_books()
+        db.session.commit()
+        return {"deleted": len(found)}, 200
+
+    # GET /books/search?q=&limit=&offset=  (solo SQLite: índice FTS5 ordenado por bm25)
+    @app.get("/books/search")
+    def search():
+        if not search_supported():
+            return {"error": "la búsqueda requiere SQLite con FTS5"}, 501
+        q = (request.args.get("q") or "").strip()
+        if not q:
+            return {"error": "falta el parámetro q"}, 400
+        try:
+            limit = int(request.args.get("limit", 20))
+            offset = int(request.args.get("offset", 0))
+        except ValueError:
+            return {"error": "limit y offset deben ser enteros"}, 400
+        if not 1 <= limit <= MAX_PAGE_SIZE or offset < 0:
+            return {"error": f"limit debe estar entre 1 y {MAX_PAGE_SIZE} y offset no puede ser negativo"}, 400
+
+        etag = collection_etag()
+        if request.if_none_match.contains_weak(etag):
+            return not_modified(etag)
+
+        # Ordenar por relevancia obliga a puntuar todas las coincidencias, así que aquí
+        # se pagina con offset: un cursor no ahorraría trabajo
+        rows = search_books(q, limit, offset)
+        headers = {}
+        if len(rows) > limit:
+            rows = rows[:limit]
+            args = {**request.args.to_dict(), "limit": limit, "offset": offset + limit}
+            headers["Link"] = f'<{url_for("search", _external=True, **args)}>; rel="next"'
+        headers["ETag"] = f'"{etag}"'
+        return jsonify(books_schema.dump(rows)), 200, headers
 
     # GET /books/<id>
     @app.get("/books/<string:book_id>")
     def get_book(book_id):
-        book = Book.query.get(book_id)
-        if not book:
+        # Para revalidar basta leer la versión, sin cargar ni serializar el libro
+        version = db.session.execute(select(Book.version).where(Book.id == book_id)).scalar()
+        if version is None:
             return {"error": "book not found"}, 404
-        return book_schema.dump(book), 200
+        if request.if_none_match.contains_weak(str(version)):
+            return not_modified(version)
+        book = db.session.get(Book, book_id)
+        return book_schema.dump(book), 200, {"ETag": f'"{book.version}"'}
 
     # POST /books
     @app.post("/books")
@@ -51,8 +343,9 @@ def create_app():
             status=data.get("status", "No leído"),
         )
         db.session.add(new_book)
+        touch_books()
         db.session.commit()
-        return book_schema.dump(new_book), 201
+        return book_schema.dump(new_book), 201, {"ETag": f'"{new_book.version}"'}
 
     # PUT /books/<id>
     @app.put("/books/<string:book_id>")
@@ -60,6 +353,9 @@ def create_app():
         book = Book.query.get(book_id)
         if not book:
             return {"error": "book not found"}, 404
+        # If-Match: solo se actualiza si el cliente editó la versión vigente
+        if request.if_match and not request.if_match.contains(str(book.version)):
+            return precondition_failed(book)
 
         json_data = request.get_json(silent=True) or {}
         # Cargar con partición de validación (aceptar campos parciales)
@@ -77,8 +373,16 @@ def create_app():
         except Exception as e:
             return {"error": str(e)}, 400
 
-        db.session.commit()
-        return book_schema.dump(book), 200
+        try:
+            # version_id_col hace UPDATE ... WHERE version = <leída>: otra escritura entre medio
+            # falla en el flush (que debe ir antes de touch_books, que también lo dispara)
+            db.session.flush()
+            touch_books()
+            db.session.commit()
+        except StaleDataError:
+            db.session.rollback()
+            return precondition_failed(db.session.get(Book, book_id))
+        return book_schema.dump(book), 200, {"ETag": f'"{book.version}"'}
 
     # DELETE /books/<id>
     @app.delete("/books/<string:book_id>")
@@ -86,8 +390,19 @@ def create_app():
         book = Book.query.get(book_id)
         if not book:
             return {"error": "book not found"}, 404
+        if request.if_match and not request.if_match.contains(str(book.version)):
+            return precondition_failed(book)
         db.session.delete(book)
-        db.session.commit()
+        try:
+            db.session.flush()
+            touch_books()
+            db.session.commit()
+        except StaleDataError:
+            db.session.rollback()
+            book = db.session.get(Book, book_id)
+            if not book:
+                return {"error": "book not found"}, 404
+            return precondition_failed(book)
         return {"message": "deleted"}, 200
 
     # Manejo global de errores
@@ -3,6 +3,8 @@ from db import db
 
 class Book(db.Model):
     __tablename__ = "books"
+    # Orden y paginación por cursor de GET /books
+    __table_args__ = (db.Index("ix_books_title_id", "title", "id"),)
 
     id = db.Column(db.String(36), primary_key=True)  # UUID en texto
     title = db.Column(db.String(200), nullable=False)
@@ -10,3 +12,15 @@ class Book(db.Model):
     genre = db.Column(db.String(80), nullable=True)
     status = db.Column(db.String(30), nullable=False, default="No leído")
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Sube en cada UPDATE; es el ETag del libro y el control de concurrencia optimista
+    version = db.Column(db.Integer, nullable=False, default=1, server_default="1")
+
+    __mapper_args__ = {"version_id_col": version}
+
+
+class ChangeCounter(db.Model):
+    """Contador por colección que sube en cada escritura; da el ETag de los listados"""
+    __tablename__ = "change_counters"
+
+    name = db.Column(db.String(40), primary_key=True)
+    value = db.Column(db.Integer, nullable=False, default=0)
@@ -0,0 +1,114 @@
+import re
+import logging
+import weakref
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from db import db
+from models import Book
+
+logger = logging.getLogger(__name__)
+
+# Índice FTS5 de contenido externo: el texto vive en `books` y books_fts solo guarda el
+# índice, enlazado por el rowid implícito de books. Los triggers lo mantienen al día.
+# Ojo: VACUUM puede renumerar rowids en tablas sin INTEGER PRIMARY KEY, así que hay que
+# compactar con `flask --app app vacuum`, que reconstruye el índice a continuación
+# (o correr `flask --app app rebuild-search` después de un VACUUM hecho a mano).
+FTS_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS books_fts USING fts5(
+        title, author, genre,
+        content='books', content_rowid='rowid',
+        tokenize='unicode61 remove_diacritics 2'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS books_fts_ai AFTER INSERT ON books BEGIN
+        INSERT INTO books_fts(rowid, title, author, genre) VALUES (new.rowid, new.title, new.author, new.genre);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS books_fts_ad AFTER DELETE ON books BEGIN
+        INSERT INTO books_fts(books_fts, rowid, title, author, genre)
+        VALUES ('delete', old.rowid, old.title, old.author, old.genre);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS books_fts_au AFTER UPDATE OF title, author, genre ON books BEGIN
+        INSERT INTO books_fts(books_fts, rowid, title, author, genre)
+        VALUES ('delete', old.rowid, old.title, old.author, old.genre);
+        INSERT INTO books_fts(rowid, title, author, genre) VALUES (new.rowid, new.title, new.author, new.genre);
+    END""",
+]
+
+# Peso de cada columna en bm25: un acierto en el título vale más que en el autor o el género
+BM25_WEIGHTS = (10.0, 5.0, 1.0)
+
+BOOK_COLUMNS = [Book.id, Book.title, Book.author, Book.genre, Book.status, Book.created_at]
+
+# Engine -> si la búsqueda quedó disponible al arrancar (lo decide setup_search)
+_available = weakref.WeakKeyDictionary()
+
+
+def has_fts5(conn):
+    return any(row[0] == "ENABLE_FTS5" for row in conn.execute(text("PRAGMA compile_options")))
+
+
+def search_supported():
+    return _available.get(db.engine, False)
+
+
+def setup_search():
+    """Crea el índice y sus triggers (idempotente). Si el índice es nuevo, indexa los libros existentes.
+
+    Sin SQLite o sin FTS5 la API arranca igual y solo /books/search responde 501.
+    """
+    _available[db.engine] = False
+    if db.engine.dialect.name != "sqlite":
+        return
+    try:
+        with db.engine.begin() as conn:
+            if not has_fts5(conn):
+                logger.warning("SQLite sin FTS5: la búsqueda de libros queda desactivada")
+                return
+            exists = conn.execute(text("SELECT 1 FROM sqlite_master WHERE name = 'books_fts'")).first()
+            for ddl in FTS_DDL:
+                conn.execute(text(ddl))
+            if not exists:
+                conn.execute(text("INSERT INTO books_fts(books_fts) VALUES ('rebuild')"))
+    except OperationalError as e:
+        logger.warning("No se pudo preparar el índice de búsqueda: %s", e)
+        return
+    _available[db.engine] = True
+
+
+def rebuild_search_index():
+    """Vuelve a indexar todos los libros (necesario si cambiaron los rowid, p. ej. tras un VACUUM)"""
+    with db.engine.begin() as conn:
+        conn.execute(text("INSERT INTO books_fts(books_fts) VALUES ('rebuild')"))
+
+
+def vacuum():
+    """Compacta la base y reconstruye el índice, cuyos rowid pueden haber quedado desfasados"""
+    with db.engine.connect() as conn:
+        conn.execute(text("VACUUM"))  # fuera de una transacción: VACUUM no puede ir dentro de una
+    if search_supported():
+        rebuild_search_index()
+
+
+def fts_query(q):
+    """Texto libre -> consulta FTS5: cada palabra entre comillas y como prefijo, todas requeridas.
+
+    Así los operadores y comillas del usuario nunca producen una consulta inválida.
+    """
+    terms = re.findall(r"\w+", q)
+    return " ".join('"%s"*' % t for t in terms)
+
+
+def search_books(q, limit, offset=0):
+    """Libros que coinciden con q ordenados por relevancia (bm25). Lee limit + 1 filas
+    para saber si hay página siguiente."""
+    match = fts_query(q)
+    if not match:
+        return []
+    weights = ", ".join(str(w) for w in BM25_WEIGHTS)
+    sql = text(f"""
+        SELECT b.id, b.title, b.author, b.genre, b.status, b.created_at
+        FROM books_fts JOIN books AS b ON b.rowid = books_fts.rowid
+        WHERE books_fts MATCH :match
+        ORDER BY bm25(books_fts, {weights}), b.rowid
+        LIMIT :limit OFFSET :offset
+    """).columns(*BOOK_COLUMNS)
+    return db.session.execute(sql, {"match": match, "limit": limit + 1, "offset": offset}).all()
@@ -0,0 +1,270 @@
+import os
+
+# app.py crea una app al importarse: que use una base en memoria y no books.db
+os.environ["DATABASE_URL"] = "sqlite://"
+
+import pytest
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+import app as books_api
+import search as books_search
+from app import create_app, migrate
+from db import db
+from models import ChangeCounter
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{tmp_path / 'books.db'}")
+    app = create_app()
+    with app.test_client() as client:
+        yield client
+    with app.app_context():
+        db.engine.dispose()
+
+
+@pytest.fixture
+def book(client):
+    r = client.post("/books", json={"title": "Rayuela", "author": "Julio Cortázar"})
+    assert r.status_code == 201
+    return r.get_json()
+
+
+@pytest.fixture
+def concurrent_write():
+    """Otra escritura sube la versión justo antes de que la petición escriba la suya."""
+    pending = [True]
+
+    def bump(session, flush_context, instances):
+        if pending:
+            pending.clear()
+            with db.engine.begin() as conn:
+                conn.execute(text("UPDATE books SET version = version + 1"))
+
+    event.listen(Session, "before_flush", bump)
+    yield
+    event.remove(Session, "before_flush", bump)
+
+
+def test_migrate_when_another_worker_created_the_counter(client, monkeypatch):
+    with client.application.app_context():
+        # Este worker no vio la fila, pero otro la insertó antes de su commit
+        monkeypatch.setattr(db.session, "get", lambda *args, **kwargs: None)
+        migrate()
+        monkeypatch.undo()
+        assert db.session.get(ChangeCounter, "books").value == 0
+
+
+def test_get_book_etag_and_not_modified(client, book):
+    r = client.get(f"/books/{book['id']}")
+    assert r.status_code == 200
+    assert r.headers["ETag"] == '"1"'
+    assert client.get(f"/books/{book['id']}", headers={"If-None-Match": '"1"'}).status_code == 304
+
+
+def test_update_with_if_match(client, book):
+    r = client.put(f"/books/{book['id']}", json={"status": "Leyendo"}, headers={"If-Match": '"1"'})
+    assert r.status_code == 200
+    assert r.headers["ETag"] == '"2"'
+
+    stale = client.put(f"/books/{book['id']}", json={"status": "Leído"}, headers={"If-Match": '"1"'})
+    assert stale.status_code == 412
+    assert stale.get_json()["version"] == 2
+
+
+def test_update_losing_the_race_is_412(client, book, concurrent_write):
+    r = client.put(f"/books/{book['id']}", json={"status": "Leído"}, headers={"If-Match": '"1"'})
+    assert r.status_code == 412
+    assert r.headers["ETag"] == '"2"'
+    assert client.get(f"/books/{book['id']}").get_json()["status"] == "No leído"
+
+
+def test_delete_losing_the_race_is_412(client, book, concurrent_write):
+    r = client.delete(f"/books/{book['id']}", headers={"If-Match": '"1"'})
+    assert r.status_code == 412
+    assert r.get_json()["version"] == 2
+    assert client.get(f"/books/{book['id']}").status_code == 200
+
+
+@pytest.fixture
+def catalog(client):
+    """Siete libros con títulos repetidos: el orden lo desempata el id"""
+    for i, title in enumerate(["B", "A", "C", "A", "B", "A", "C"]):
+        assert client.post("/books", json={"title": title, "author": f"autor {i}"}).status_code == 201
+    return sorted((b["title"], b["id"]) for b in client.get("/books").get_json())
+
+
+def test_list_walks_pages_with_cursor(client, catalog):
+    seen, params = [], {"limit": 2}
+    while True:
+        r = client.get("/books", query_string=params)
+        assert r.status_code == 200
+        seen += [(b["title"], b["id"]) for b in r.get_json()]
+        if "X-Next-Cursor" not in r.headers:
+            break
+        assert 'rel="next"' in r.headers["Link"]
+        params = {"limit": 2, "cursor": r.headers["X-Next-Cursor"]}
+    assert seen == catalog
+
+
+def test_list_without_paging_returns_the_whole_catalog(client, catalog):
+    r = client.get("/books")
+    assert len(r.get_json()) == len(catalog)
+    assert "X-Next-Cursor" not in r.headers
+
+
+def test_list_projects_fields(client, catalog):
+    books = client.get("/books", query_string={"fields": "author"}).get_json()
+    assert len(books) == len(catalog)
+    assert all(list(b) == ["author"] for b in books)
+
+
+@pytest.mark.parametrize("params", [
+    {"cursor": "no-es-un-cursor"},
+    {"cursor": "WzEsIDJd"},  # JSON válido, pero [1, 2] no es (title, id)
+    {"limit": "diez"},
+    {"limit": 0},
+    {"limit": 100000},
+    {"fields": "title,isbn"},
+])
+def test_list_rejects_bad_parameters(client, params):
+    r = client.get("/books", query_string=params)
+    assert r.status_code == 400
+    assert "error" in r.get_json()
+
+
+def counter(client):
+    with client.application.app_context():
+        return db.session.get(ChangeCounter, "books").value
+
+
+def test_bulk_create_is_all_or_nothing(client):
+    r = client.post("/books/bulk", json=[
+        {"title": "Ficciones", "author": "Borges"},
+        {"title": "Sin autor"},
+        {"title": "Pedro Páramo", "author": "Rulfo", "status": "Perdido"},
+    ])
+    assert r.status_code == 400
+    assert [item["index"] for item in r.get_json()["items"]] == [1, 2]
+    assert "author" in r.get_json()["items"][0]["errors"]
+    assert client.get("/books").get_json() == []
+
+    r = client.post("/books/bulk", json={"books": [{"title": "Ficciones", "author": "Borges"}] * 3})
+    assert r.status_code == 201
+    assert r.get_json()["created"] == 3
+    assert len(client.get("/books").get_json()) == 3
+
+
+def test_bulk_update_bumps_versions_and_collection(client, book):
+    other = client.post("/books", json={"title": "Aura", "author": "Carlos Fuentes"}).get_json()
+    before = counter(client)
+    r = client.patch("/books/bulk", json=[
+        {"id": book["id"], "status": "Leído"},
+        {"id": other["id"], "title": "Aura (2ª ed.)", "genre": "Novela"},
+    ])
+    assert r.status_code == 200
+    assert r.get_json() == {"updated": 2}
+    assert counter(client) == before + 1
+
+    updated = client.get(f"/books/{book['id']}")
+    assert updated.headers["ETag"] == '"2"'
+    assert updated.get_json()["status"] == "Leído"
+    assert updated.get_json()["title"] == "Rayuela"  # lo no enviado no cambia
+    assert client.get(f"/books/{other['id']}").get_json()["genre"] == "Novela"
+
+
+def test_bulk_update_invalid_item_changes_nothing(client, book):
+    r = client.patch("/books/bulk", json=[{"id": book["id"], "status": "Leído"}, {"status": "Leído"}])
+    assert r.status_code == 400
+    assert r.get_json()["items"] == [{"index": 1, "errors": {"id": ["requerido"]}}]
+    assert client.get(f"/books/{book['id']}").get_json()["status"] == "No leído"
+
+
+def test_bulk_unknown_ids_are_404(client, book):
+    before = counter(client)
+    r = client.patch("/books/bulk", json=[{"id": book["id"], "status": "Leído"}, {"id": "no-existe", "status": "Leído"}])
+    assert r.status_code == 404
+    assert r.get_json()["items"] == [{"index": 1, "errors": {"id": ["book not found"]}}]
+
+    r = client.delete("/books/bulk", json={"ids": [book["id"], "no-existe"]})
+    assert r.status_code == 404
+    assert [item["index"] for item in r.get_json()["items"]] == [1]
+
+    assert client.get(f"/books/{book['id']}").get_json()["status"] == "No leído"
+    assert counter(client) == before
+
+
+def test_bulk_delete(client, book):
+    r = client.delete("/books/bulk", json=[book["id"]])
+    assert r.status_code == 200
+    assert r.get_json() == {"deleted": 1}
+    assert client.get(f"/books/{book['id']}").status_code == 404
+
+
+def test_bulk_too_many_items_is_413(client, monkeypatch):
+    monkeypatch.setattr(books_api, "MAX_BULK_ITEMS", 2)
+    r = client.post("/books/bulk", json=[{"title": "x", "author": "y"}] * 3)
+    assert r.status_code == 413
+    assert client.delete("/books/bulk", json=["a", "b", "c"]).status_code == 413
+    assert client.get("/books").get_json() == []
+
+
+def search(client, q, **params):
+    r = client.get("/books/search", query_string={"q": q, **params})
+    assert r.status_code == 200
+    return [b["title"] for b in r.get_json()]
+
+
+def test_search_prefix_and_relevance(client):
+    client.post("/books/bulk", json=[
+        {"title": "Historia de la novela", "author": "Ana Cortés"},
+        {"title": "Cuentos completos", "author": "Julio Cortázar"},
+        {"title": "Cortázar: una biografía", "author": "Miguel Herráez"},
+    ])
+    assert search(client, "cuent") == ["Cuentos completos"]
+    # Coincidir en el título pesa más que en el autor; "cortazar" también encuentra "Cortázar"
+    assert search(client, "cortazar") == ["Cortázar: una biografía", "Cuentos completos"]
+
+
+def test_search_index_follows_writes(client, book):
+    assert search(client, "rayuela") == ["Rayuela"]
+    client.put(f"/books/{book['id']}", json={"title": "Los premios"})
+    assert search(client, "rayuela") == []
+    assert search(client, "premios") == ["Los premios"]
+
+    client.patch("/books/bulk", json=[{"id": book["id"], "title": "Bestiario"}])
+    assert search(client, "premios") == []
+    assert search(client, "bestiario") == ["Bestiario"]
+
+    client.delete("/books/bulk", json=[book["id"]])
+    assert search(client, "bestiario") == []
+
+
+@pytest.mark.parametrize("q", ['"', "AND", "NOT rayuela", "ray*", "title:rayuela", "NEAR(a b", "-)(^", "'; --"])
+def test_search_operators_in_query_are_plain_text(client, book, q):
+    assert client.get("/books/search", query_string={"q": q}).status_code == 200
+
+
+def test_rebuild_search_after_rowids_change(client):
+    client.post("/books/bulk", json=[{"title": f"Libro {n}", "author": "x"} for n in ("uno", "dos", "tres")])
+    cli = client.application.test_cli_runner()
+    assert cli.invoke(args=["vacuum"]).exit_code == 0
+    assert search(client, "tres") == ["Libro tres"]
+
+    # Lo que puede hacer un VACUUM: rowid nuevos que los triggers no ven
+    with client.application.app_context(), db.engine.begin() as conn:
+        conn.execute(text("UPDATE books SET rowid = rowid + 100"))
+    assert search(client, "tres") == []
+    result = cli.invoke(args=["rebuild-search"])
+    assert result.exit_code == 0, result.output
+    assert search(client, "tres") == ["Libro tres"]
+
+
+def test_api_boots_without_fts5(tmp_path, monkeypatch):
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{tmp_path / 'sin_fts.db'}")
+    monkeypatch.setattr(books_search, "has_fts5", lambda conn: False)
+    client = create_app().test_client()
+    assert client.post("/books", json={"title": "Rayuela", "author": "Cortázar"}).status_code == 201
+    assert client.get("/books/search", query_string={"q": "rayuela"}).status_code == 501
+    with client.application.app_context():
+        db.engine.dispose()
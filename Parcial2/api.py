@@ -1,53 +1,134 @@
-from fastapi import APIRouter, HTTPException
-from typing import List
-from .models import VaccineRecord, VaccineList, ProvinceRecord
-from .repository import VaccineRepository
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from typing import List, Optional
+from .models import VaccineRecord, VaccineList, ProvinceRecord, ProvinceStats, SeriesSummary, RangeStats
+from .repository import VaccineRepository, PRIMARY_COUNTRY, PRIMARY_INDICATOR
+from .response_cache import cached_json
 
 router = APIRouter()
 
-# Este repositorio será inyectado desde main.py
+# Tamaño máximo de página en /vacunas?limit=
+MAX_PAGE_SIZE = 1000
+
+# Este repositorio será inyectado desde main.py (y reemplazado entero en cada recarga)
 repo: VaccineRepository | None = None
 
 
-@router.get("/vacunas", response_model=VaccineList, tags=["vacunas"])
-async def get_all():
+def get_repo() -> VaccineRepository:
+    """
+    Repositorio vigente. Cada petición lo toma una sola vez, así que aunque
+    loader.py lo reemplace a mitad de la petición, esta sigue viendo el mismo.
+    """
     assert repo is not None
-    return {"data": repo.all()}
+    return repo
+
+
+@router.get("/vacunas", response_model=VaccineList, tags=["vacunas"])
+async def get_all(
+    request: Request,
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE, description="Registros por página"),
+    after_year: Optional[int] = Query(None, description="Cursor: devuelve los años posteriores a este"),
+    current: VaccineRepository = Depends(get_repo),
+):
+    """
+    Registros de la serie principal. Con `limit`/`after_year` se pagina por año (el
+    cursor siguiente va en las cabeceras Link y X-Next-After-Year) y con
+    `Accept: application/x-ndjson` se transmite un registro JSON por línea.
+    """
+    ndjson = "application/x-ndjson" in request.headers.get("accept", "")
+    if limit is None and after_year is None and not ndjson:
+        return cached_json(request, current, "vacunas", VaccineList, lambda: {"data": current.all()})
+
+    records, next_after = current.page(after_year, limit)
+    headers = {}
+    if next_after is not None:
+        headers["X-Next-After-Year"] = str(next_after)
+        headers["Link"] = f'<{request.url.include_query_params(after_year=next_after)}>; rel="next"'
+    if ndjson:
+        # Cada registro se serializa al enviarlo: memoria constante y primeros bytes inmediatos
+        lines = (r.model_dump_json().encode() + b"\n" for r in records)
+        return StreamingResponse(lines, media_type="application/x-ndjson", headers=headers)
+    response.headers.update(headers)
+    return {"data": list(records)}
+
+
+# Debe declararse antes de /vacunas/{year}, que si no capturaría "stats"
+@router.get("/vacunas/stats", response_model=RangeStats, tags=["vacunas"])
+async def get_range_stats(
+    from_year: Optional[int] = Query(None, alias="from", description="Primer año (por defecto, el primero con registro)"),
+    to_year: Optional[int] = Query(None, alias="to", description="Último año inclusive"),
+    province: Optional[str] = Query(None, description="Provincia simulada (solo serie principal)"),
+    country: str = Query(PRIMARY_COUNTRY, description="Código ISO3 del país"),
+    indicator: str = Query(PRIMARY_INDICATOR, description="Código del indicador"),
+    current: VaccineRepository = Depends(get_repo),
+):
+    """Media, mínimo, máximo y pendiente de la cobertura entre dos años (ignora años sin dato)."""
+    if from_year is not None and to_year is not None and from_year > to_year:
+        raise HTTPException(status_code=400, detail="'from' no puede ser mayor que 'to'")
+    stats = current.range_stats(from_year, to_year, country, indicator, province)
+    if stats is None:
+        raise HTTPException(status_code=404, detail="Serie o provincia no encontrada")
+    return stats
 
 
 @router.get("/vacunas/{year}", response_model=VaccineRecord, tags=["vacunas"])
-async def get_by_year(year: int):
-    assert repo is not None
-    rec = repo.by_year(year)
+async def get_by_year(year: int, request: Request, current: VaccineRepository = Depends(get_repo)):
+    rec = current.by_year(year)
     if not rec:
         raise HTTPException(status_code=404, detail="No hay registro para ese año")
-    return rec
+    return cached_json(request, current, f"vacunas/{year}", VaccineRecord, lambda: rec)
+
+
+@router.get("/vacunas/provincias/estadisticas", response_model=List[ProvinceStats], tags=["vacunas"])
+async def get_province_stats(current: VaccineRepository = Depends(get_repo)):
+    """Media, mínimo y máximo simulados por provincia sobre todos los años con dato."""
+    return current.province_stats()
 
 
 @router.get("/vacunas/provincia/{name}", response_model=List[ProvinceRecord], tags=["vacunas"])
-async def get_province_years(name: str):
+async def get_province_years(name: str, current: VaccineRepository = Depends(get_repo)):
     """
     Devuelve todos los años simulados para una provincia dada.
-    (Conveniencia adicional)
+    (Conveniencia adicional; no distingue mayúsculas ni acentos)
     """
-    assert repo is not None
-    name_norm = name.strip().lower()
-    years = sorted({r.year for r in repo.all()})
-    out: list[ProvinceRecord] = []
-    for y in years:
-        provs = repo.provinces_for_year(y)
-        match = next((p for p in provs if p.province.lower() == name_norm), None)
-        if match:
-            out.append(match)
+    out = current.province_series(name)
     if not out:
         raise HTTPException(status_code=404, detail="Provincia no encontrada o sin datos")
     return out
 
 
 @router.get("/vacunas/{year}/provincias", response_model=list[ProvinceRecord], tags=["vacunas"])
-async def get_all_provinces_for_year(year: int):
+async def get_all_provinces_for_year(year: int, request: Request, current: VaccineRepository = Depends(get_repo)):
     """Devuelve datos simulados por provincia para un año dado."""
-    assert repo is not None
-    if not repo.by_year(year):
+    if not current.by_year(year):
         raise HTTPException(status_code=404, detail="No hay registro para ese año")
-    return repo.provinces_for_year(year)
+    return cached_json(request, current, f"vacunas/{year}/provincias", List[ProvinceRecord],
+                       lambda: current.provinces_for_year(year))
+
+
+@router.get("/indicadores", response_model=List[SeriesSummary], tags=["indicadores"])
+async def get_series_catalog(request: Request, current: VaccineRepository = Depends(get_repo)):
+    """Series (país, indicador) disponibles con su rango de años."""
+    return cached_json(request, current, "indicadores", List[SeriesSummary], current.series_catalog)
+
+
+@router.get("/indicadores/{country}/{indicator}", response_model=VaccineList, tags=["indicadores"])
+async def get_series(country: str, indicator: str, request: Request, current: VaccineRepository = Depends(get_repo)):
+    """Serie completa de un indicador para un país (códigos ISO3 y del Banco Mundial)."""
+    rows = current.series(country, indicator)
+    if not rows:
+        raise HTTPException(status_code=404, detail="No hay datos para ese país e indicador")
+    key = f"indicadores/{country.upper()}/{indicator.upper()}"
+    return cached_json(request, current, key, VaccineList, lambda: {"data": rows})
+
+
+@router.get("/indicadores/{country}/{indicator}/{year}", response_model=VaccineRecord, tags=["indicadores"])
+async def get_series_year(
+    country: str, indicator: str, year: int, request: Request, current: VaccineRepository = Depends(get_repo)
+):
+    rec = current.get(country, indicator, year)
+    if not rec:
+        raise HTTPException(status_code=404, detail="No hay registro para ese país, indicador y año")
+    key = f"indicadores/{country.upper()}/{indicator.upper()}/{year}"
+    return cached_json(request, current, key, VaccineRecord, lambda: rec)
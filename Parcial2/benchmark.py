@@ -0,0 +1,251 @@
+"""
+Benchmark de la API con un Banco Mundial simulado (sin red).
+
+Uso (desde el directorio que contiene el paquete `app`):
+    python -m app.benchmark --countries 20 --indicators 50 --years 60
+    python -m app.benchmark --json actual.json --baseline anterior.json
+"""
+import gc
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import tracemalloc
+from typing import Any, Dict, List, Tuple
+import httpx
+from . import data_fetcher
+from .data_fetcher import fetch_world_bank_data
+from .loader import RepositoryLoader
+from .main import create_app
+from .repository import PRIMARY_COUNTRY, PRIMARY_INDICATOR, PANAMA_PROVINCES
+from . import api as api_routes
+
+FIRST_YEAR = 1960
+
+
+# ------------------------------
+# 🔹 Banco Mundial simulado
+# ------------------------------
+
+def synthetic_pairs(n_countries: int, n_indicators: int) -> List[Tuple[str, str]]:
+    """Pares (país, indicador) sintéticos; el primero siempre es la serie principal."""
+    countries = [PRIMARY_COUNTRY] + [f"X{i // 26 % 26 + 65:c}{i % 26 + 65:c}" for i in range(n_countries - 1)]
+    indicators = [PRIMARY_INDICATOR] + [f"SH.IMM.S{i:03d}" for i in range(n_indicators - 1)]
+    return [(c, i) for c in countries for i in indicators]
+
+
+def world_bank_transport(n_years: int, seed: int = 0) -> httpx.MockTransport:
+    """
+    Transporte httpx que responde como /v2/country/{c}/indicator/{i} del Banco Mundial,
+    con paginación, para cualquier país e indicador (valores deterministas, ~5% nulos).
+    """
+    def handler(request: httpx.Request) -> httpx.Response:
+        parts = request.url.path.rstrip("/").split("/")
+        country, indicator = parts[-3], parts[-1]
+        page = int(request.url.params.get("page", 1))
+        per_page = int(request.url.params.get("per_page", 50))
+        rng = random.Random(f"{seed}-{country}-{indicator}")
+        values = [None if rng.random() < 0.05 else round(rng.uniform(40, 100), 1) for _ in range(n_years)]
+        # El Banco Mundial devuelve los años en orden descendente
+        years = list(range(FIRST_YEAR + n_years - 1, FIRST_YEAR - 1, -1))
+        rows = [
+            {"country": {"id": country, "value": f"Country {country}"}, "countryiso3code": country,
+             "indicator": {"id": indicator, "value": f"Indicator {indicator}"},
+             "date": str(year), "value": values[year - FIRST_YEAR]}
+            for year in years[(page - 1) * per_page:page * per_page]
+        ]
+        pages = max(1, -(-n_years // per_page))
+        return httpx.Response(200, json=[{"page": page, "pages": pages, "per_page": per_page, "total": n_years}, rows])
+
+    return httpx.MockTransport(handler)
+
+
+# ------------------------------
+# 🔹 Mediciones
+# ------------------------------
+
+def make_loader(pairs: List[Tuple[str, str]], transport: httpx.MockTransport, snapshot_path: str) -> RepositoryLoader:
+    return RepositoryLoader(
+        fetcher=lambda: fetch_world_bank_data(pairs, transport=transport),
+        snapshot_path=snapshot_path, interval=0, shared_dir="",
+    )
+
+
+async def measure_startup(
+    pairs: List[Tuple[str, str]], transport: httpx.MockTransport, tmp: str
+) -> Tuple[RepositoryLoader, Dict[str, Any]]:
+    """
+    Arranque en frío: descarga, normalización, construcción del repositorio y snapshot.
+    La memoria se mide en una pasada aparte porque tracemalloc multiplica el tiempo.
+    """
+    tracemalloc.start()
+    traced = make_loader(pairs, transport, f"{tmp}/traced.json")
+    await traced.start()
+    gc.collect()  # sin la basura cíclica de httpx/asyncio, current ≈ lo que retiene el repositorio
+    # peak incluye además la descarga y la normalización
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    await traced.stop()
+
+    loader = make_loader(pairs, transport, f"{tmp}/snapshot.json")
+    started = time.perf_counter()
+    await loader.start()
+    seconds = time.perf_counter() - started
+    return loader, {
+        "segundos": round(seconds, 4),
+        "pico_mb": round(peak / 1e6, 1),
+        "retenido_mb": round(current / 1e6, 1),
+        "series": len(pairs),
+    }
+
+
+def endpoint_paths(rng: random.Random, pairs: List[Tuple[str, str]], n_years: int) -> Dict[str, Any]:
+    """Por endpoint (plantilla), una función que genera una URL concreta al azar."""
+    last = FIRST_YEAR + n_years - 1
+
+    def year() -> int:
+        return rng.randint(FIRST_YEAR, last)
+
+    def pair() -> Tuple[str, str]:
+        return rng.choice(pairs)
+
+    def stats() -> str:
+        a = year()
+        return f"/vacunas/stats?from={a}&to={rng.randint(a, last)}"
+
+    return {
+        "/vacunas": lambda: "/vacunas",
+        "/vacunas?limit=": lambda: f"/vacunas?limit=20&after_year={year()}",
+        "/vacunas (ndjson)": lambda: "/vacunas?after_year=0",
+        "/vacunas/{year}": lambda: f"/vacunas/{year()}",
+        "/vacunas/{year}/provincias": lambda: f"/vacunas/{year()}/provincias",
+        "/vacunas/stats": stats,
+        "/vacunas/provincia/{name}": lambda: f"/vacunas/provincia/{rng.choice(PANAMA_PROVINCES)}",
+        "/vacunas/provincias/estadisticas": lambda: "/vacunas/provincias/estadisticas",
+        "/indicadores": lambda: "/indicadores",
+        "/indicadores/{c}/{i}": lambda: "/indicadores/%s/%s" % pair(),
+        "/indicadores/{c}/{i}/{year}": lambda: "/indicadores/%s/%s/%d" % (*pair(), year()),
+    }
+
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    k = max(0, min(len(sorted_values) - 1, round(p / 100 * len(sorted_values)) - 1))
+    return sorted_values[k]
+
+
+async def drive(client: httpx.AsyncClient, name: str, make_path, requests: int, concurrency: int) -> Dict[str, Any]:
+    """Lanza `requests` peticiones con `concurrency` clientes simultáneos y resume latencias."""
+    latencies: List[float] = []
+    errors = 0
+    headers = {"Accept": "application/x-ndjson"} if "ndjson" in name else {"Accept-Encoding": "gzip"}
+    queue = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for _ in queue:
+            start = time.perf_counter()
+            r = await client.get(make_path(), headers=headers)
+            await r.aread()
+            latencies.append(time.perf_counter() - start)
+            errors += r.status_code >= 400
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "endpoint": name,
+        "peticiones": requests,
+        "errores": errors,
+        "rps": round(requests / wall, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+    }
+
+
+async def run_benchmarks(args) -> Dict[str, Any]:
+    data_fetcher.WB_PER_PAGE = args.per_page
+    pairs = synthetic_pairs(args.countries, args.indicators)
+    transport = world_bank_transport(args.years, args.seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        loader, startup = await measure_startup(pairs, transport, tmp)
+    startup["registros"] = len(pairs) * args.years
+    app = create_app(loader)
+    rng = random.Random(args.seed)
+    filas = []
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+            for name, make_path in endpoint_paths(rng, pairs, args.years).items():
+                if args.endpoints and name not in args.endpoints:
+                    continue
+                await drive(client, name, make_path, min(20, args.requests), args.concurrency)  # calentamiento
+                filas.append(await drive(client, name, make_path, args.requests, args.concurrency))
+    finally:
+        await loader.stop()
+        api_routes.repo = None
+    return {"arranque": startup, "endpoints": filas}
+
+
+def compare(result: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Regresiones frente a una corrida anterior (más latencia p95, menos throughput, arranque más lento)."""
+    regresiones = []
+    previas = {f["endpoint"]: f for f in baseline.get("endpoints", [])}
+    for fila in result["endpoints"]:
+        previa = previas.get(fila["endpoint"])
+        if not previa:
+            continue
+        if fila["p95_ms"] > previa["p95_ms"] * (1 + tolerance):
+            regresiones.append(f"{fila['endpoint']}: p95 {previa['p95_ms']:.2f}ms -> {fila['p95_ms']:.2f}ms")
+        if fila["rps"] < previa["rps"] / (1 + tolerance):
+            regresiones.append(f"{fila['endpoint']}: {previa['rps']:.0f} -> {fila['rps']:.0f} req/s")
+    antes, ahora = baseline.get("arranque"), result["arranque"]
+    if antes:
+        if ahora["segundos"] > antes["segundos"] * (1 + tolerance):
+            regresiones.append(f"arranque: {antes['segundos']:.2f}s -> {ahora['segundos']:.2f}s")
+        if ahora["pico_mb"] > antes["pico_mb"] * (1 + tolerance):
+            regresiones.append(f"memoria pico: {antes['pico_mb']}MB -> {ahora['pico_mb']}MB")
+    return regresiones
+
+
+def print_table(result: Dict[str, Any]) -> None:
+    a = result["arranque"]
+    print(f"🚀 Arranque: {a['segundos']:.3f}s, pico {a['pico_mb']} MB, retenido {a['retenido_mb']} MB "
+          f"({a['series']} series, {a['registros']} registros)")
+    print(f"{'endpoint':<36}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errores':>9}")
+    for f in result["endpoints"]:
+        print(f"{f['endpoint']:<36}{f['rps']:>10.1f}{f['p50_ms']:>10.2f}{f['p95_ms']:>10.2f}"
+              f"{f['p99_ms']:>10.2f}{f['errores']:>9}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark de la API de vacunas con el Banco Mundial simulado")
+    parser.add_argument("--countries", type=int, default=20)
+    parser.add_argument("--indicators", type=int, default=50)
+    parser.add_argument("--years", type=int, default=60)
+    parser.add_argument("--per-page", type=int, default=data_fetcher.WB_PER_PAGE, help="Tamaño de página del BM")
+    parser.add_argument("--requests", type=int, default=500, help="Peticiones por endpoint")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--endpoints", nargs="+", help="Solo estos endpoints (nombres de la tabla)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Guarda los resultados en este archivo")
+    parser.add_argument("--baseline", help="Resultados previos (JSON) para detectar regresiones")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Margen aceptado frente al baseline")
+    args = parser.parse_args()
+
+    result = asyncio.run(run_benchmarks(args))
+    print_table(result)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regresiones = compare(result, json.load(f), args.tolerance)
+        for r in regresiones:
+            print("❌", r)
+        sys.exit(1 if regresiones else 0)
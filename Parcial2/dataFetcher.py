@@ -1,53 +1,168 @@
 import os
-from typing import List, Dict, Any
+import json
+import time
+import random
+import tempfile
+import asyncio
+import warnings
+from typing import List, Dict, Any, Optional, Tuple
 import httpx
 from dotenv import load_dotenv
+from .repository import PRIMARY_COUNTRY, PRIMARY_INDICATOR
 
 load_dotenv()
 
-WB_API_URL = os.getenv(
-    "WB_API_URL",
-    "https://api.worldbank.org/v2/country/PAN/indicator/SH.IMM.MEAS?format=json&per_page=20000",
-)
+WB_BASE_URL = os.getenv("WB_BASE_URL", "https://api.worldbank.org/v2")
+# Obsoleta: URL completa de la serie principal (PAN × SH.IMM.MEAS). Si está definida,
+# esa serie se sigue descargando de ahí, con los parámetros de su query.
+WB_API_URL = os.getenv("WB_API_URL", "")
+if WB_API_URL:
+    warnings.warn(
+        "WB_API_URL está obsoleta: usa WB_BASE_URL, WB_COUNTRIES y WB_INDICATORS. "
+        "Por ahora se usa como URL de la serie principal.",
+        FutureWarning,
+    )
+# Países (ISO3) e indicadores a descargar; se pide cada combinación país × indicador
+WB_COUNTRIES = [
+    c.strip().upper() for c in os.getenv("WB_COUNTRIES", "PAN,CRI,NIC,HND,SLV,GTM,BLZ").split(",") if c.strip()
+]
+WB_INDICATORS = [
+    i.strip().upper()
+    for i in os.getenv("WB_INDICATORS", "SH.IMM.MEAS,SH.IMM.IDPT,SH.IMM.HEPB,SH.IMM.POL3").split(",")
+    if i.strip()
+]
+# Peticiones simultáneas contra el Banco Mundial y tamaño de página
+WB_CONCURRENCY = int(os.getenv("WB_CONCURRENCY", "8"))
+WB_PER_PAGE = int(os.getenv("WB_PER_PAGE", "1000"))
+# Reintentos por página ante errores de red, 429 y 5xx, con espera exponencial (segundos)
+WB_RETRIES = int(os.getenv("WB_RETRIES", "3"))
+WB_BACKOFF = float(os.getenv("WB_BACKOFF", "0.5"))
+RETRY_STATUS = {429, 500, 502, 503, 504}
 
+# Copia local de los registros normalizados para arrancar sin esperar al Banco Mundial
+SNAPSHOT_PATH = os.getenv("WB_SNAPSHOT_PATH", "vacunas_snapshot.json")
 
-async def fetch_world_bank_data() -> List[Dict[str, Any]]:
+
+async def fetch_world_bank_data(
+    pairs: Optional[List[Tuple[str, str]]] = None, transport: Optional[httpx.AsyncBaseTransport] = None
+) -> List[Dict[str, Any]]:
     """
-    Descarga y prepara los registros del Banco Mundial para Panamá (SH.IMM.MEAS).
-    Devuelve una lista de dicts normalizados: {country, indicator, code, year, value}.
+    Descarga y prepara los registros del Banco Mundial para cada par (país, indicador)
+    (por defecto WB_COUNTRIES × WB_INDICATORS); la serie principal sale de WB_API_URL
+    si está definida. Todas las series se piden a la vez
+    sobre un único cliente con conexiones reutilizadas, siguiendo la paginación.
+    Devuelve una lista de dicts normalizados:
+    {country, country_code, indicator, code, year, value}.
+    Cada página se reintenta hasta WB_RETRIES veces; si aun así alguna serie falla se
+    propaga el error (el loader conserva los datos actuales).
+    `transport` permite sustituir la red (p. ej. httpx.MockTransport en pruebas).
     """
-    async with httpx.AsyncClient(timeout=20) as client:
-        r = await client.get(WB_API_URL)
-        r.raise_for_status()
-        payload = r.json()
+    if pairs is None:
+        pairs = [(c, i) for c in WB_COUNTRIES for i in WB_INDICATORS]
+    semaphore = asyncio.Semaphore(WB_CONCURRENCY)
+    limits = httpx.Limits(max_connections=WB_CONCURRENCY, max_keepalive_connections=WB_CONCURRENCY)
+    async with httpx.AsyncClient(base_url=WB_BASE_URL, timeout=20, limits=limits, transport=transport) as client:
+        series = await asyncio.gather(
+            *(_fetch_series(client, semaphore, country, indicator) for country, indicator in pairs)
+        )
+
+    out = [rec for rows in series for rec in rows]
+    # Ordenar por país, indicador y año ascendente
+    out.sort(key=lambda x: (x["country_code"], x["code"], x["year"]))
+    return out
+
+
+async def _fetch_page(client: httpx.AsyncClient, semaphore: asyncio.Semaphore, url: str, page: int) -> Any:
+    # Lo que ya venga en la query de la URL (WB_API_URL) manda sobre los valores por defecto
+    params = {"format": "json", "per_page": WB_PER_PAGE, **httpx.URL(url).params, "page": page}
+    for attempt in range(WB_RETRIES + 1):
+        try:
+            async with semaphore:
+                r = await client.get(url, params=params)
+            if r.status_code not in RETRY_STATUS or attempt == WB_RETRIES:
+                r.raise_for_status()
+                return r.json()
+        except httpx.TransportError:
+            if attempt == WB_RETRIES:
+                raise
+        # Espera fuera del semáforo para no bloquear a las demás series; el jitter evita
+        # que todas las páginas fallidas vuelvan a la vez
+        await asyncio.sleep(WB_BACKOFF * 2 ** attempt * random.uniform(0.5, 1.5))
+
 
-    # payload = [meta, data]
-    if not isinstance(payload, list) or len(payload) < 2:
+async def _fetch_series(
+    client: httpx.AsyncClient, semaphore: asyncio.Semaphore, country: str, indicator: str
+) -> List[Dict[str, Any]]:
+    """Una serie completa: la primera página dice cuántas hay y el resto se pide en paralelo."""
+    pinned = bool(WB_API_URL) and (country, indicator) == (PRIMARY_COUNTRY, PRIMARY_INDICATOR)
+    url = WB_API_URL if pinned else f"/country/{country}/indicator/{indicator}"
+    first = await _fetch_page(client, semaphore, url, 1)
+    # payload = [meta, data]; un indicador o país inválido devuelve solo [{"message": ...}]
+    if not isinstance(first, list) or len(first) < 2:
         return []
+    pages = int(first[0].get("pages") or 1)
+    payloads = [first]
+    if pages > 1:
+        payloads += await asyncio.gather(*(_fetch_page(client, semaphore, url, p) for p in range(2, pages + 1)))
 
-    _, data = payload
     out: List[Dict[str, Any]] = []
+    for payload in payloads:
+        if isinstance(payload, list) and len(payload) >= 2:
+            out.extend(_normalize(payload[1] or [], country, indicator))
+    if pinned:
+        # Como antes de WB_BASE_URL: lo que devuelva esa URL es la serie principal
+        for rec in out:
+            rec["country_code"], rec["code"] = country, indicator
+    return out
 
+
+def _normalize(data: List[Dict[str, Any]], country: str, indicator: str) -> List[Dict[str, Any]]:
+    out: List[Dict[str, Any]] = []
     for row in data:
-        # row campos típicos: country, indicator, date (año), value
+        # row campos típicos: country, countryiso3code, indicator, date (año), value
         try:
-            country_name = row.get("country", {}).get("value", "Panama")
-            indicator_name = row.get("indicator", {}).get("value", "SH.IMM.MEAS")
-            year = int(row.get("date"))
             value = row.get("value")  # puede ser None
             out.append(
                 {
-                    "country": country_name,
-                    "indicator": indicator_name,
-                    "code": "SH.IMM.MEAS",
-                    "year": year,
+                    "country": row.get("country", {}).get("value", country),
+                    "country_code": (row.get("countryiso3code") or country).upper(),
+                    "indicator": row.get("indicator", {}).get("value", indicator),
+                    "code": row.get("indicator", {}).get("id", indicator),
+                    "year": int(row.get("date")),
                     "value": float(value) if value is not None else None,
                 }
             )
         except Exception:
             # Ignorar registros mal formados
             continue
-
-    # Ordenar por año ascendente
-    out.sort(key=lambda x: x["year"])
     return out
+
+
+def save_snapshot(records: List[Dict[str, Any]], path: str = SNAPSHOT_PATH) -> None:
+    """
+    Guarda los registros normalizados en un archivo JSON local.
+    Se escribe en un temporal propio (varios workers pueden guardar a la vez) y se
+    renombra, así nunca queda un snapshot a medias.
+    """
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), prefix=os.path.basename(path) + ".",
+                               suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump({"saved_at": time.time(), "records": records}, f, ensure_ascii=False)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def load_snapshot(path: str = SNAPSHOT_PATH) -> Optional[Tuple[List[Dict[str, Any]], float]]:
+    """
+    Lee el snapshot local. Devuelve (registros, instante de guardado) o None
+    si no existe o está corrupto.
+    """
+    try:
+        with open(path, encoding="utf-8") as f:
+            payload = json.load(f)
+        return payload["records"], float(payload["saved_at"])
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
@@ -0,0 +1,170 @@
+import os
+import time
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from .data_fetcher import fetch_world_bank_data, load_snapshot, save_snapshot, SNAPSHOT_PATH
+from .repository import VaccineRepository
+from .shared_store import SharedStore, MappedDataset, SHARED_DIR, SHARED_POLL_SECONDS
+from . import api as api_routes
+
+logger = logging.getLogger(__name__)
+
+# Cada cuánto se vuelve a consultar el Banco Mundial (segundos; 0 = solo al arrancar)
+REFRESH_SECONDS = float(os.getenv("WB_REFRESH_SECONDS", "3600"))
+# Espera antes de reintentar cuando una recarga falla
+RETRY_SECONDS = float(os.getenv("WB_RETRY_SECONDS", "60"))
+
+Fetcher = Callable[[], Awaitable[List[Dict[str, Any]]]]
+
+
+class RepositoryLoader:
+    """
+    Mantiene api.repo actualizado con estrategia stale-while-revalidate:
+    arranca al instante desde el snapshot local (si existe) y refresca desde
+    el Banco Mundial en una tarea de fondo cada `interval` segundos.
+
+    Con `shared_dir` (WB_SHARED_DIR) los workers de uvicorn comparten un dataset
+    mapeado en memoria: solo el worker que gana el flock consulta el Banco Mundial
+    y publica versiones nuevas; el resto mapea la vigente y la revisa cada
+    SHARED_POLL_SECONDS, así que un worker reiniciado arranca al instante.
+    """
+
+    def __init__(
+        self,
+        fetcher: Fetcher = fetch_world_bank_data,
+        snapshot_path: str = SNAPSHOT_PATH,
+        interval: float = REFRESH_SECONDS,
+        shared_dir: str = SHARED_DIR,
+    ):
+        self.fetcher = fetcher
+        self.snapshot_path = snapshot_path
+        self.interval = interval
+        self.data_timestamp: Optional[float] = None  # cuándo se obtuvieron los datos servidos
+        self.last_reload_seconds: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+        self.store: Optional[SharedStore] = SharedStore(shared_dir) if shared_dir else None
+        self.is_leader = False
+        self._dataset_name: Optional[str] = None
+        self._dataset: Optional[MappedDataset] = None
+
+    async def start(self) -> None:
+        if self.store is not None:
+            return await self._start_shared()
+        snapshot = await asyncio.to_thread(load_snapshot, self.snapshot_path)
+        if snapshot is not None:
+            records, saved_at = snapshot
+            await self._swap(records)
+            self.data_timestamp = saved_at
+            # Se sirve el snapshot y se revalida enseguida en segundo plano
+            first_delay = 0.0
+        elif await self.refresh():
+            if self.interval <= 0:
+                return
+            first_delay = self.interval
+        else:
+            # Sin snapshot ni Banco Mundial: se arranca vacío y se reintenta en segundo plano
+            await self._swap([])
+            first_delay = RETRY_SECONDS
+        self._task = asyncio.create_task(self._loop(first_delay))
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.store is not None:
+            self.store.release()
+            self.is_leader = False
+
+    async def refresh(self) -> bool:
+        """Descarga, construye el repositorio nuevo y lo publica. True si hubo datos."""
+        started = time.perf_counter()
+        try:
+            records = await self.fetcher()
+        except Exception as e:
+            logger.warning("No se pudo actualizar desde el Banco Mundial: %s", e)
+            return False
+        if not records:
+            logger.warning("El Banco Mundial devolvió 0 registros; se mantienen los datos actuales")
+            return False
+        if self.store is not None:
+            # El cargador publica y luego mapea lo publicado, igual que los demás workers
+            await asyncio.to_thread(self.store.publish, records, time.time())
+            await self.adopt_shared()
+        else:
+            await self._swap(records)
+        self.data_timestamp = time.time()
+        self.last_reload_seconds = time.perf_counter() - started
+        try:
+            await asyncio.to_thread(save_snapshot, records, self.snapshot_path)
+        except OSError as e:
+            logger.warning("No se pudo guardar el snapshot %s: %s", self.snapshot_path, e)
+        return True
+
+    async def _swap(self, records: List[Dict[str, Any]]) -> None:
+        # El repositorio nuevo se construye completo fuera del event loop; publicarlo es
+        # una sola asignación, así ninguna petición ve uno a medio construir.
+        new_repo = await asyncio.to_thread(VaccineRepository, records)
+        api_routes.repo = new_repo
+
+    async def _loop(self, first_delay: float) -> None:
+        delay = first_delay
+        while True:
+            await asyncio.sleep(delay)
+            ok = await self.refresh()
+            if ok and self.interval <= 0:
+                return
+            delay = self.interval if ok else RETRY_SECONDS
+
+    # ------------------------------
+    # 🔹 Modo compartido entre workers
+    # ------------------------------
+
+    async def _start_shared(self) -> None:
+        await self.adopt_shared()
+        self.is_leader = self.store.try_acquire()
+        if self._dataset_name is None and self.is_leader:
+            # Primer arranque sin dataset: se publica el snapshot JSON si hay, si no se descarga ya
+            snapshot = await asyncio.to_thread(load_snapshot, self.snapshot_path)
+            if snapshot is not None:
+                await asyncio.to_thread(self.store.publish, *snapshot)
+                await self.adopt_shared()
+            else:
+                await self.refresh()
+        if self._dataset_name is None:
+            # Los demás workers esperan vacíos hasta que el cargador publique
+            await self._swap([])
+        self._task = asyncio.create_task(self._shared_loop())
+
+    async def adopt_shared(self) -> bool:
+        """Mapea el dataset vigente si cambió desde el último. True si hubo cambio."""
+        name = await asyncio.to_thread(self.store.current_name)
+        if name is None or name == self._dataset_name:
+            return False
+        try:
+            dataset = await asyncio.to_thread(self.store.open, name)
+        except (OSError, ValueError) as e:
+            logger.warning("No se pudo mapear el dataset compartido %s: %s", name, e)
+            return False
+        api_routes.repo = await asyncio.to_thread(VaccineRepository.from_series, dataset.series)
+        # La referencia anterior se suelta sin cerrar el mmap: peticiones en curso aún pueden leerlo
+        self._dataset, self._dataset_name = dataset, name
+        self.data_timestamp = dataset.saved_at
+        return True
+
+    async def _shared_loop(self) -> None:
+        next_refresh = (self.data_timestamp or 0.0) + self.interval
+        while True:
+            await asyncio.sleep(SHARED_POLL_SECONDS)
+            if await self.adopt_shared():
+                next_refresh = self.data_timestamp + self.interval
+            if not self.is_leader:
+                # Si el cargador murió, su flock se liberó y otro worker toma el relevo
+                self.is_leader = self.store.try_acquire()
+            if self.is_leader and (self._dataset_name is None or self.interval > 0) and time.time() >= next_refresh:
+                ok = await self.refresh()
+                next_refresh = time.time() + (self.interval if ok else RETRY_SECONDS)
@@ -1,16 +1,21 @@
 import uvicorn
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
-from .data_fetcher import fetch_world_bank_data
-from .repository import VaccineRepository
+from .loader import RepositoryLoader
+from .metrics import RequestMetrics, render_prometheus
+from .response_cache import cache as response_cache
 from . import api as api_routes
 
 
-def create_app() -> FastAPI:
+def create_app(loader: RepositoryLoader | None = None) -> FastAPI:
     app = FastAPI(
         title="Panamá Sarampión (12–23 meses) – API de solo lectura",
         version="1.0.0",
-        description="Cobertura del indicador SH.IMM.MEAS (World Bank) para Panamá.",
+        description=(
+            "Cobertura del indicador SH.IMM.MEAS (World Bank) para Panamá, y otros indicadores "
+            "de inmunización para Centroamérica en /indicadores."
+        ),
     )
 
     # CORS abierto (ajusta para producción)
@@ -21,10 +26,26 @@ def create_app() -> FastAPI:
         allow_headers=["*"],
     )
 
+    # Arranca desde el snapshot local y refresca desde el Banco Mundial en segundo plano
+    loader = loader or RepositoryLoader()
+    app.state.loader = loader
+
     @app.on_event("startup")
     async def load_data():
-        records = await fetch_world_bank_data()
-        api_routes.repo = VaccineRepository(records)
+        await loader.start()
+
+    @app.on_event("shutdown")
+    async def stop_refresh():
+        await loader.stop()
+
+    # Métricas por plantilla de ruta, de la caché de respuestas y del repositorio
+    app.state.metrics = RequestMetrics()
+    app.state.metrics.install(app)
+
+    @app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+    async def metrics():
+        text = render_prometheus(app.state.metrics, loader, api_routes.repo, response_cache)
+        return PlainTextResponse(text, media_type="text/plain; version=0.0.4")
 
     app.include_router(api_routes.router)
     return app
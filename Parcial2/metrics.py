@@ -0,0 +1,138 @@
+import time
+import bisect
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from fastapi import FastAPI
+from starlette.routing import Match
+
+# Límites (segundos) de los histogramas de latencia
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+# Etiqueta para rutas que no existen (no se usa la URL cruda para no disparar la cardinalidad)
+UNMATCHED = "<sin ruta>"
+
+
+class Histogram:
+    """Histograma acumulativo al estilo Prometheus."""
+
+    def __init__(self, buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # el último es +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def lines(self, name: str, labels: str = "") -> List[str]:
+        prefix = f"{labels}," if labels else ""
+        suffix = f"{{{labels}}}" if labels else ""
+        out, acc = [], 0
+        for le, n in zip([*map(repr, self.buckets), "+Inf"], self.counts):
+            acc += n
+            out.append(f'{name}_bucket{{{prefix}le="{le}"}} {acc}')
+        out.append(f"{name}_sum{suffix} {self.sum}")
+        out.append(f"{name}_count{suffix} {self.count}")
+        return out
+
+
+class RequestMetrics:
+    """Contadores, peticiones en curso y latencias por plantilla de ruta ("/vacunas/{year}")."""
+
+    def __init__(self):
+        self.requests: Dict[Tuple[str, str, int], int] = defaultdict(int)
+        self.in_flight: Dict[str, int] = defaultdict(int)
+        self.latency: Dict[str, Histogram] = defaultdict(Histogram)
+
+    def install(self, app: FastAPI) -> None:
+        app.add_middleware(MetricsMiddleware, metrics=self, routes=app.router.routes)
+
+
+class MetricsMiddleware:
+    """
+    Middleware ASGI puro (BaseHTTPMiddleware duplica el costo de cada petición).
+    Mide desde que llega la petición hasta que se envía el último byte.
+    """
+
+    def __init__(self, app, metrics: RequestMetrics, routes: List[Any]):
+        self.app = app
+        self.metrics = metrics
+        self.routes = routes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        metrics = self.metrics
+        route = route_template(self.routes, scope)
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        metrics.in_flight[route] += 1
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            metrics.latency[route].observe(time.perf_counter() - started)
+            metrics.requests[(scope["method"], route, status)] += 1
+            metrics.in_flight[route] -= 1
+
+
+def route_template(routes: List[Any], scope: Dict[str, Any]) -> str:
+    for route in routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return getattr(route, "path", UNMATCHED)
+    return UNMATCHED
+
+
+def _label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def render_prometheus(
+    metrics: RequestMetrics, loader: Any = None, repo: Any = None, cache: Any = None, now: Optional[float] = None
+) -> str:
+    """Todas las métricas en formato de texto de Prometheus (0.0.4)."""
+    now = time.time() if now is None else now
+    out: List[str] = []
+
+    def family(name: str, kind: str, help_: str) -> None:
+        out.append(f"# HELP {name} {help_}")
+        out.append(f"# TYPE {name} {kind}")
+
+    family("http_requests_total", "counter", "Peticiones atendidas por método, ruta y estado")
+    for (method, route, status), n in sorted(metrics.requests.items()):
+        out.append(f'http_requests_total{{method="{method}",route="{_label(route)}",status="{status}"}} {n}')
+    family("http_requests_in_flight", "gauge", "Peticiones en curso por ruta")
+    for route, n in sorted(metrics.in_flight.items()):
+        out.append(f'http_requests_in_flight{{route="{_label(route)}"}} {n}')
+    family("http_request_duration_seconds", "histogram", "Latencia por ruta (hasta enviar la respuesta completa)")
+    for route, hist in sorted(metrics.latency.items()):
+        out.extend(hist.lines("http_request_duration_seconds", f'route="{_label(route)}"'))
+
+    if cache is not None:
+        family("response_cache_requests_total", "counter", "Respuestas pre-renderizadas servidas de la caché o renderizadas")
+        out.append(f'response_cache_requests_total{{result="hit"}} {cache.hits}')
+        out.append(f'response_cache_requests_total{{result="miss"}} {cache.misses}')
+        family("response_render_seconds", "histogram", "Validación, serialización y compresión de una respuesta")
+        out.extend(cache.render_seconds.lines("response_render_seconds"))
+
+    if repo is not None:
+        family("repository_records", "gauge", "Registros cargados en el repositorio vigente")
+        out.append(f"repository_records {repo.count()}")
+        family("repository_version", "gauge", "Versión del repositorio vigente (sube en cada recarga)")
+        out.append(f"repository_version {repo.version}")
+    if loader is not None:
+        if loader.last_reload_seconds is not None:
+            family("repository_reload_duration_seconds", "gauge", "Duración de la última recarga desde el Banco Mundial")
+            out.append(f"repository_reload_duration_seconds {loader.last_reload_seconds}")
+        if loader.data_timestamp is not None:
+            family("repository_data_age_seconds", "gauge", "Antigüedad de los datos servidos (snapshot o última descarga)")
+            out.append(f"repository_data_age_seconds {now - loader.data_timestamp}")
+    return "\n".join(out) + "\n"
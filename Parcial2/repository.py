@@ -1,7 +1,13 @@
-from typing import List, Optional, Dict, Any
-from .models import VaccineRecord, ProvinceRecord
+from typing import List, Optional, Dict, Any, Iterator, Sequence, Tuple
+from .models import VaccineRecord, ProvinceRecord, ProvinceStats, SeriesSummary, RangeStats
+import sys
 import math
+import bisect
+import itertools
+from array import array
 import hashlib
+import unicodedata
+import numpy as np
 
 PANAMA_PROVINCES = [
     "Bocas del Toro", "Coclé", "Colón", "Chiriquí", "Darién",
@@ -9,43 +15,323 @@ PANAMA_PROVINCES = [
     "Guna Yala", "Emberá", "Ngäbe-Buglé"
 ]
 
+# Serie que alimenta /vacunas y la simulación provincial (sarampión en Panamá)
+PRIMARY_COUNTRY = "PAN"
+PRIMARY_INDICATOR = "SH.IMM.MEAS"
+
+# Cada repositorio construido recibe una versión nueva (sirve de clave para cachés de respuestas)
+_versions = itertools.count(1)
+
 
 class VaccineRepository:
     """
     Repositorio en memoria. Se carga al iniciar la app con los datos del BM.
+    Guarda todas las series por (país, indicador, año); la serie principal
+    (PRIMARY_COUNTRY, PRIMARY_INDICATOR) alimenta /vacunas y las provincias.
     """
     def __init__(self, records: List[Dict[str, Any]]):
-        self._records = [VaccineRecord(**r) for r in records]
-        # Índices simples por año
-        self._by_year: Dict[int, VaccineRecord] = {r.year: r for r in self._records}
+        self._load(group_series(records))
+
+    @classmethod
+    def from_series(cls, series: Dict[Tuple[str, str], "SeriesColumns"]) -> "VaccineRepository":
+        """Repositorio sobre columnas ya construidas (p. ej. mapeadas desde shared_store)."""
+        repo = cls.__new__(cls)
+        repo._load(series)
+        return repo
+
+    def _load(self, series: Dict[Tuple[str, str], "SeriesColumns"]) -> None:
+        self.version = next(_versions)
+        # Series por (país, indicador) en columnas compactas; los VaccineRecord se crean al responder
+        self._series = series
+        self._primary = self._series.get((PRIMARY_COUNTRY, PRIMARY_INDICATOR)) or SeriesColumns(
+            "", PRIMARY_COUNTRY, "", PRIMARY_INDICATOR, {}
+        )
+        self._build_province_matrix()
+        self._build_range_indexes()
+
+    def _build_province_matrix(self) -> None:
+        """
+        Precalcula una sola vez la simulación provincial como matriz densa año × provincia.
+        Las filas cuyo valor nacional es None quedan en NaN (ver self._missing).
+        """
+        self._years = np.array(self._primary.years, dtype=np.int32)
+        national = np.array(self._primary.values, dtype=np.float64)
+        self._missing = np.isnan(national)
+        offsets = np.array(
+            [[province_offset(p, y) for p in PANAMA_PROVINCES] for y in self._years.tolist()],
+            dtype=np.float64,
+        ).reshape(len(self._years), len(PANAMA_PROVINCES))
+        # NaN se propaga por clip/round, así que los años sin dato nacional quedan en NaN
+        self._province_matrix = np.round(np.clip(national[:, None] + offsets, 0.0, 100.0), 1)
+        self._year_row: Dict[int, int] = {y: i for i, y in enumerate(self._years.tolist())}
+        # Filas ya materializadas: /vacunas/{year}/provincias solo devuelve una de ellas
+        self._province_rows: Dict[int, List[ProvinceRecord]] = {
+            year: [
+                ProvinceRecord(province=p, year=year, value=None if math.isnan(v) else v)
+                for p, v in zip(PANAMA_PROVINCES, self._province_matrix[i].tolist())
+            ]
+            for year, i in self._year_row.items()
+        }
+        # Serie completa por provincia (años ascendentes), indexada por nombre normalizado
+        self._by_province: Dict[str, List[ProvinceRecord]] = {
+            normalize_name(p): [self._province_rows[y][j] for y in self._years.tolist()]
+            for j, p in enumerate(PANAMA_PROVINCES)
+        }
+
+    def _build_range_indexes(self) -> None:
+        """Índices de agregados por rango para cada serie nacional y cada provincia simulada."""
+        self._series_ranges: Dict[Tuple[str, str], RangeIndex] = {
+            key: RangeIndex(series.years.tolist(), series.values.tolist()) for key, series in self._series.items()
+        }
+        years = self._years.tolist()
+        self._province_ranges: Dict[str, Tuple[str, RangeIndex]] = {
+            normalize_name(p): (p, RangeIndex(years, self._province_matrix[:, j].tolist()))
+            for j, p in enumerate(PANAMA_PROVINCES)
+        }
+
+    def count(self) -> int:
+        """Registros cargados entre todas las series."""
+        return sum(len(s.years) for s in self._series.values())
 
     def all(self) -> List[VaccineRecord]:
-        return list(self._records)
+        return self._primary.records()
 
     def by_year(self, year: int) -> Optional[VaccineRecord]:
-        return self._by_year.get(year)
+        return self._primary.record(year)
+
+    def page(
+        self, after_year: Optional[int] = None, limit: Optional[int] = None
+    ) -> Tuple[Iterator[VaccineRecord], Optional[int]]:
+        """
+        Página de la serie principal: años posteriores a `after_year`, como mucho `limit`.
+        Devuelve un iterador perezoso y el cursor de la página siguiente (None si es la
+        última). Hay un registro por año, así que una página nunca parte un año.
+        """
+        years = self._primary.years
+        start = 0 if after_year is None else bisect.bisect_right(years, after_year)
+        stop = len(years) if limit is None else min(len(years), start + limit)
+        next_after = years[stop - 1] if start < stop < len(years) else None
+        return self._primary.iter_records(start, stop), next_after
+
+    def series_catalog(self) -> List[SeriesSummary]:
+        """Una entrada por serie (país, indicador) cargada, ordenadas por país e indicador."""
+        return [
+            SeriesSummary(
+                country_code=s.country_code, country=s.country, code=s.code, indicator=s.indicator,
+                first_year=s.years[0], last_year=s.years[-1], years=len(s.years),
+            )
+            for _, s in sorted(self._series.items())
+        ]
+
+    def series(self, country: str, indicator: str) -> List[VaccineRecord]:
+        """Todos los años de una serie; códigos sin distinguir mayúsculas. Lista vacía si no existe."""
+        series = self._series.get((country.upper(), indicator.upper()))
+        return series.records() if series else []
+
+    def get(self, country: str, indicator: str, year: int) -> Optional[VaccineRecord]:
+        series = self._series.get((country.upper(), indicator.upper()))
+        return series.record(year) if series else None
 
     def provinces_for_year(self, year: int) -> List[ProvinceRecord]:
         """
         Simula datos provinciales a partir del valor nacional de ese año.
         Si el valor nacional es None, devuelve provincias con None.
         La simulación reparte +/- hasta ~3 puntos porcentuales deterministas por provincia.
+        Los valores se calculan al cargar; aquí solo se devuelve la fila del año.
+        """
+        return list(self._province_rows.get(year, []))
+
+    def province_series(self, name: str) -> List[ProvinceRecord]:
+        """
+        Todos los años simulados de una provincia. El nombre no distingue
+        mayúsculas ni acentos ("cocle" -> "Coclé"). Lista vacía si no existe.
+        """
+        return list(self._by_province.get(normalize_name(name), []))
+
+    def range_stats(
+        self,
+        from_year: Optional[int] = None,
+        to_year: Optional[int] = None,
+        country: str = PRIMARY_COUNTRY,
+        indicator: str = PRIMARY_INDICATOR,
+        province: Optional[str] = None,
+    ) -> Optional[RangeStats]:
         """
-        base = self.by_year(year)
-        if not base:
-            return []
-
-        if base.value is None:
-            return [ProvinceRecord(province=p, year=year, value=None) for p in PANAMA_PROVINCES]
-
-        out: List[ProvinceRecord] = []
-        for prov in PANAMA_PROVINCES:
-            # offset determinista por provincia y año en [-3, +3]
-            h = hashlib.sha256(f"{prov}-{year}".encode()).hexdigest()
-            # tomar 2 bytes, mapear a [0,1], escalar a [-3, +3]
-            v = int(h[:4], 16) / 0xFFFF
-            offset = (v * 6.0) - 3.0
-            val = max(0.0, min(100.0, base.value + offset))
-            # redondeo a una cifra decimal
-            out.append(ProvinceRecord(province=prov, year=year, value=round(val, 1)))
-        return out
+        Media, mínimo, máximo y pendiente (puntos por año) entre dos años inclusive,
+        para una serie nacional o, en la serie principal, para una provincia simulada.
+        Se responde en tiempo constante con los índices precalculados; los años sin
+        valor no cuentan. None si la serie o la provincia no existen.
+        """
+        country, indicator = country.upper(), indicator.upper()
+        if province is None:
+            index = self._series_ranges.get((country, indicator))
+            province_name = None
+        elif (country, indicator) == (PRIMARY_COUNTRY, PRIMARY_INDICATOR):
+            province_name, index = self._province_ranges.get(normalize_name(province), (None, None))
+        else:
+            index = None
+        if index is None:
+            return None
+        lo = index.first if from_year is None else from_year
+        hi = index.last if to_year is None else to_year
+        return RangeStats(country_code=country, code=indicator, province=province_name,
+                          from_year=lo, to_year=hi, **index.query(lo, hi))
+
+    def province_stats(self) -> List[ProvinceStats]:
+        """
+        Estadísticas por provincia (media, mínimo, máximo) sobre los años con dato,
+        calculadas por columnas sobre la matriz precalculada.
+        """
+        valid = ~self._missing
+        m = self._province_matrix[valid]
+        if m.shape[0] == 0:
+            return [ProvinceStats(province=p, years=0, mean=None, min=None, max=None) for p in PANAMA_PROVINCES]
+        means = np.round(m.mean(axis=0), 2).tolist()
+        mins = m.min(axis=0).tolist()
+        maxs = m.max(axis=0).tolist()
+        return [
+            ProvinceStats(province=p, years=int(m.shape[0]), mean=means[i], min=mins[i], max=maxs[i])
+            for i, p in enumerate(PANAMA_PROVINCES)
+        ]
+
+
+def group_series(records: List[Dict[str, Any]]) -> Dict[Tuple[str, str], "SeriesColumns"]:
+    """Agrupa registros normalizados por (país, indicador); un año repetido se queda con el último."""
+    grouped: Dict[Tuple[str, str], Tuple[Dict[str, Any], Dict[int, float]]] = {}
+    for r in records:
+        key = (r.get("country_code", PRIMARY_COUNTRY).upper(), r["code"].upper())
+        first, values = grouped.setdefault(key, (r, {}))
+        values[int(r["year"])] = math.nan if r.get("value") is None else float(r["value"])
+    return {
+        key: SeriesColumns(first["country"], key[0], first["indicator"], key[1], values)
+        for key, (first, values) in grouped.items()
+    }
+
+
+class SeriesColumns:
+    """
+    Una serie (país, indicador) en columnas: años ascendentes en array('i') y valores en
+    array('d') (NaN = sin dato), unos 12 bytes por año. Las cadenas se guardan una sola
+    vez por serie e internadas, así que se comparten entre series y recargas.
+    Las columnas también pueden ser memoryviews sobre un archivo mapeado (ver from_buffers).
+    """
+    __slots__ = ("country", "country_code", "indicator", "code", "years", "values")
+
+    def __init__(self, country: str, country_code: str, indicator: str, code: str, values: Dict[int, float]):
+        self.country = sys.intern(country)
+        self.country_code = sys.intern(country_code)
+        self.indicator = sys.intern(indicator)
+        self.code = sys.intern(code)
+        ordered = sorted(values)
+        self.years = array("i", ordered)
+        self.values = array("d", (values[y] for y in ordered))
+
+    @classmethod
+    def from_buffers(
+        cls, country: str, country_code: str, indicator: str, code: str, years: Sequence[int], values: Sequence[float]
+    ) -> "SeriesColumns":
+        """Serie sobre columnas existentes, sin copiarlas (memoryview 'i' y 'd')."""
+        series = cls.__new__(cls)
+        series.country, series.country_code = sys.intern(country), sys.intern(country_code)
+        series.indicator, series.code = sys.intern(indicator), sys.intern(code)
+        series.years, series.values = years, values
+        return series
+
+    def _view(self, i: int) -> VaccineRecord:
+        value = self.values[i]
+        return VaccineRecord(
+            country=self.country, country_code=self.country_code, indicator=self.indicator, code=self.code,
+            year=self.years[i], value=None if math.isnan(value) else value,
+        )
+
+    def record(self, year: int) -> Optional[VaccineRecord]:
+        i = bisect.bisect_left(self.years, year)
+        return self._view(i) if i < len(self.years) and self.years[i] == year else None
+
+    def records(self) -> List[VaccineRecord]:
+        return list(self.iter_records())
+
+    def iter_records(self, start: int = 0, stop: Optional[int] = None) -> Iterator[VaccineRecord]:
+        """Crea los VaccineRecord de las filas [start, stop) a medida que se piden."""
+        for i in range(start, len(self.years) if stop is None else stop):
+            yield self._view(i)
+
+
+class RangeIndex:
+    """
+    Agregados de un rango de años en O(1). Los valores se colocan en un eje de años
+    denso (los años sin valor quedan en NaN) y al construir se calculan:
+    - sumas prefijas de conteo, y, x, x² y x·y (media y pendiente por mínimos cuadrados)
+    - sparse tables de mínimo y máximo (dos bloques solapados de 2^k cubren cualquier rango)
+    """
+
+    def __init__(self, years: List[int], values: List[Optional[float]]):
+        self.first = min(years) if years else 0
+        self.last = max(years) if years else -1
+        dense = np.full(self.last - self.first + 1, np.nan)
+        for year, value in zip(years, values):
+            if value is not None:
+                dense[year - self.first] = value
+        valid = ~np.isnan(dense)
+        y = np.where(valid, dense, 0.0)
+        # x relativo al primer año para que las sumas de cuadrados no pierdan precisión
+        x = np.where(valid, np.arange(len(dense), dtype=np.float64), 0.0)
+
+        def prefix(a: np.ndarray) -> array:
+            return _doubles(np.concatenate(([0.0], np.cumsum(a))))
+
+        self._count, self._sum_y, self._sum_x = prefix(valid.astype(np.float64)), prefix(y), prefix(x)
+        self._sum_xx, self._sum_xy = prefix(x * x), prefix(x * y)
+
+        mins, maxs = [np.where(valid, dense, np.inf)], [np.where(valid, dense, -np.inf)]
+        k = 1
+        while (1 << k) <= len(dense):
+            half = 1 << (k - 1)
+            mins.append(np.minimum(mins[-1][:-half], mins[-1][half:]))
+            maxs.append(np.maximum(maxs[-1][:-half], maxs[-1][half:]))
+            k += 1
+        self._min = [_doubles(level) for level in mins]
+        self._max = [_doubles(level) for level in maxs]
+
+    def query(self, from_year: int, to_year: int) -> Dict[str, Any]:
+        lo = max(from_year, self.first) - self.first
+        hi = min(to_year, self.last) - self.first
+        n = self._count[hi + 1] - self._count[lo] if lo <= hi else 0
+        if not n:
+            return {"years": 0, "mean": None, "min": None, "max": None, "slope": None}
+        sum_y = self._sum_y[hi + 1] - self._sum_y[lo]
+        sum_x = self._sum_x[hi + 1] - self._sum_x[lo]
+        sum_xx = self._sum_xx[hi + 1] - self._sum_xx[lo]
+        sum_xy = self._sum_xy[hi + 1] - self._sum_xy[lo]
+        k = (hi - lo + 1).bit_length() - 1
+        right = hi - (1 << k) + 1
+        denominator = n * sum_xx - sum_x * sum_x
+        slope = (n * sum_xy - sum_x * sum_y) / denominator if n >= 2 and denominator else None
+        return {
+            "years": int(n),
+            "mean": round(sum_y / n, 2),
+            "min": min(self._min[k][lo], self._min[k][right]),
+            "max": max(self._max[k][lo], self._max[k][right]),
+            "slope": None if slope is None else round(slope, 4),
+        }
+
+
+def _doubles(a: np.ndarray) -> array:
+    """array('d') compacto con los valores de un ndarray (indexarlo devuelve float de Python)."""
+    out = array("d")
+    out.frombytes(np.ascontiguousarray(a, dtype=np.float64).tobytes())
+    return out
+
+
+def normalize_name(name: str) -> str:
+    """Normaliza un nombre para búsquedas: sin espacios extremos, acentos ni mayúsculas."""
+    decomposed = unicodedata.normalize("NFKD", name.strip())
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).casefold()
+
+
+def province_offset(province: str, year: int) -> float:
+    """Offset determinista por provincia y año en [-3, +3]."""
+    h = hashlib.sha256(f"{province}-{year}".encode()).hexdigest()
+    # tomar 2 bytes, mapear a [0,1], escalar a [-3, +3]
+    v = int(h[:4], 16) / 0xFFFF
+    return (v * 6.0) - 3.0
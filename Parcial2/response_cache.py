@@ -0,0 +1,109 @@
+import time
+import gzip
+import hashlib
+from typing import Any, Callable, Dict, Iterable, NamedTuple, Optional, Tuple
+from fastapi import Request, Response
+from pydantic import TypeAdapter
+from .repository import VaccineRepository
+from .metrics import Histogram
+
+try:
+    import brotli
+except ImportError:  # brotli es opcional: sin él solo se ofrecen gzip e identity
+    brotli = None
+
+# Por debajo de este tamaño comprimir no compensa
+MIN_COMPRESS_BYTES = 512
+
+
+class RenderedResponse(NamedTuple):
+    bodies: Dict[str, bytes]  # codificación ("identity", "gzip", "br") -> bytes
+    etags: Dict[str, str]     # codificación -> ETag fuerte de esa representación
+
+
+def render(model: Any, data: Any) -> RenderedResponse:
+    """Valida y serializa una vez con el response_model, y precomprime el resultado."""
+    adapter = TypeAdapter(model)
+    body = adapter.dump_json(adapter.validate_python(data))
+    digest = hashlib.sha256(body).hexdigest()[:32]
+    bodies = {"identity": body}
+    if len(body) >= MIN_COMPRESS_BYTES:
+        bodies["gzip"] = gzip.compress(body, compresslevel=9, mtime=0)
+        if brotli is not None:
+            bodies["br"] = brotli.compress(body, quality=11)
+    etags = {enc: f'"{digest}"' if enc == "identity" else f'"{digest}-{enc}"' for enc in bodies}
+    return RenderedResponse(bodies, etags)
+
+
+class ResponseCache:
+    """
+    JSON ya renderizado por (versión del repositorio, endpoint). Como los datos solo
+    cambian al recargar el repositorio, cada respuesta se valida, serializa y
+    comprime una sola vez por versión; las versiones viejas se descartan.
+    """
+
+    def __init__(self):
+        self._latest = 0
+        self._entries: Dict[Tuple[int, str], RenderedResponse] = {}
+        # Para /metrics: cuánto se sirve ya hecho y cuánto cuesta renderizar
+        self.hits = 0
+        self.misses = 0
+        self.render_seconds = Histogram()
+
+    def get(self, repo: VaccineRepository, key: str, model: Any, build: Callable[[], Any]) -> RenderedResponse:
+        rendered = self._entries.get((repo.version, key))
+        if rendered is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+            started = time.perf_counter()
+            rendered = render(model, build())
+            self.render_seconds.observe(time.perf_counter() - started)
+            # Una petición que aún usa un repositorio viejo no debe ensuciar la caché
+            if repo.version >= self._latest:
+                if repo.version > self._latest:
+                    self._entries = {k: v for k, v in self._entries.items() if k[0] >= repo.version}
+                    self._latest = repo.version
+                self._entries[(repo.version, key)] = rendered
+        return rendered
+
+
+cache = ResponseCache()
+
+
+def negotiate(accept_encoding: str, available: Iterable[str]) -> str:
+    """Elige br > gzip > identity según Accept-Encoding (respetando q=0)."""
+    accepted = {}
+    for part in accept_encoding.split(","):
+        token, _, params = part.strip().partition(";")
+        q = 1.0
+        if params.strip().startswith("q="):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        if token:
+            accepted[token.strip().lower()] = q
+    for enc in ("br", "gzip"):
+        if enc in available and accepted.get(enc, accepted.get("*", 0.0)) > 0:
+            return enc
+    return "identity"
+
+
+def etag_matches(if_none_match: Optional[str], etags: Iterable[str]) -> bool:
+    if not if_none_match:
+        return False
+    candidates = {t.strip().removeprefix("W/") for t in if_none_match.split(",")}
+    return "*" in candidates or any(tag in candidates for tag in etags)
+
+
+def cached_json(request: Request, repo: VaccineRepository, key: str, model: Any, build: Callable[[], Any]) -> Response:
+    """Respuesta desde la caché con ETag fuerte, 304 Not Modified y precompresión."""
+    rendered = cache.get(repo, key, model, build)
+    enc = negotiate(request.headers.get("accept-encoding", ""), rendered.bodies)
+    headers = {"ETag": rendered.etags[enc], "Vary": "Accept-Encoding", "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), rendered.etags.values()):
+        return Response(status_code=304, headers=headers)
+    if enc != "identity":
+        headers["Content-Encoding"] = enc
+    return Response(content=rendered.bodies[enc], media_type="application/json", headers=headers)
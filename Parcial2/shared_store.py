@@ -0,0 +1,141 @@
+import os
+import json
+import mmap
+import glob
+import struct
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from .repository import SeriesColumns, group_series
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin flock cada worker se comporta como cargador
+    fcntl = None
+
+# Directorio compartido por los workers de uvicorn ("" = modo desactivado, cada worker con su copia)
+SHARED_DIR = os.getenv("WB_SHARED_DIR", "")
+# Cada cuánto los workers que no cargan revisan si hay un dataset nuevo
+SHARED_POLL_SECONDS = float(os.getenv("WB_SHARED_POLL_SECONDS", "5"))
+
+MAGIC = b"VACS"
+FORMAT_VERSION = 1
+# magic, formato, instante de los datos, nº de registros, largo del JSON de series
+HEADER = struct.Struct("<4sIdQI")
+
+
+def _pad8(n: int) -> int:
+    return (n + 7) & ~7
+
+
+class MappedDataset:
+    """
+    Dataset abierto en solo lectura con mmap. Las columnas de cada serie son
+    memoryviews sobre el archivo, así que todos los workers comparten las mismas
+    páginas del page cache. Mientras quede algún repositorio usándolo, el mapeo
+    sigue vivo aunque el archivo ya se haya reemplazado o borrado.
+    """
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._mm)
+        magic, fmt, self.saved_at, n, meta_len = HEADER.unpack_from(view)
+        if magic != MAGIC or fmt != FORMAT_VERSION:
+            raise ValueError(f"{path} no es un dataset compartido válido")
+        meta_start = HEADER.size
+        years_start = _pad8(meta_start + meta_len)
+        values_start = _pad8(years_start + 4 * n)
+        meta = json.loads(bytes(view[meta_start:meta_start + meta_len]))
+        years = view[years_start:years_start + 4 * n].cast("i")
+        values = view[values_start:values_start + 8 * n].cast("d")
+        self.series: Dict[Tuple[str, str], SeriesColumns] = {
+            (country_code, code): SeriesColumns.from_buffers(
+                country, country_code, indicator, code, years[start:start + count], values[start:start + count]
+            )
+            for country, country_code, indicator, code, start, count in meta
+        }
+
+
+class SharedStore:
+    """
+    Dataset normalizado compartido entre workers a través de un directorio:
+
+    - dataset-<ns>.bin: cabecera, JSON con las series y dos columnas contiguas
+      (años int32 y valores float64, en el orden de bytes de la máquina)
+    - current: nombre del dataset vigente; se reemplaza con os.replace, así que
+      cambiar de versión es atómico y no requiere reiniciar workers
+    - loader.lock: flock que elige al único worker que consulta el Banco Mundial
+    """
+
+    def __init__(self, directory: str = SHARED_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._pointer = os.path.join(directory, "current")
+        self._lock_file = None
+
+    def try_acquire(self) -> bool:
+        """True si este proceso es (o acaba de convertirse en) el cargador."""
+        if self._lock_file is not None:
+            return True
+        f = open(os.path.join(self.directory, "loader.lock"), "a+b")
+        if fcntl is not None:
+            try:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                f.close()
+                return False
+        self._lock_file = f
+        return True
+
+    def release(self) -> None:
+        if self._lock_file is not None:
+            self._lock_file.close()  # cerrar libera el flock
+            self._lock_file = None
+
+    def current_name(self) -> Optional[str]:
+        try:
+            with open(self._pointer, encoding="utf-8") as f:
+                return f.read().strip() or None
+        except OSError:
+            return None
+
+    def open(self, name: str) -> MappedDataset:
+        return MappedDataset(os.path.join(self.directory, name))
+
+    def publish(self, records: List[Dict[str, Any]], saved_at: Optional[float] = None) -> str:
+        """Escribe un dataset nuevo, lo apunta como vigente y borra los anteriores al previo."""
+        series = group_series(records)
+        meta, years, values = [], [], []
+        for (country_code, code), s in sorted(series.items()):
+            meta.append([s.country, country_code, s.indicator, code, len(years), len(s.years)])
+            years.extend(s.years)
+            values.extend(s.values)
+        meta_bytes = json.dumps(meta, ensure_ascii=False).encode("utf-8")
+        header = HEADER.pack(MAGIC, FORMAT_VERSION, saved_at or time.time(), len(years), len(meta_bytes))
+
+        name = f"dataset-{time.time_ns()}-{os.getpid()}.bin"
+        path = os.path.join(self.directory, name)
+        with open(f"{path}.tmp", "wb") as f:
+            f.write(header + meta_bytes)
+            f.write(b"\0" * (_pad8(f.tell()) - f.tell()))
+            f.write(struct.pack(f"={len(years)}i", *years))
+            f.write(b"\0" * (_pad8(f.tell()) - f.tell()))
+            f.write(struct.pack(f"={len(values)}d", *values))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(f"{path}.tmp", path)
+
+        previous = self.current_name()
+        with open(f"{self._pointer}.tmp", "w", encoding="utf-8") as f:
+            f.write(name)
+        os.replace(f"{self._pointer}.tmp", self._pointer)
+
+        # Se conserva el previo para workers que todavía no cambiaron; en POSIX borrar
+        # un archivo mapeado no invalida los mapeos existentes.
+        for old in glob.glob(os.path.join(self.directory, "dataset-*.bin")):
+            if os.path.basename(old) not in (name, previous):
+                try:
+                    os.remove(old)
+                except OSError:
+                    pass
+        return name
@@ -1,8 +1,15 @@
+import json
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import httpx
 import pytest
 from fastapi.testclient import TestClient
 from app.main import create_app
 from app.repository import VaccineRepository
+from app.loader import RepositoryLoader
+from app.data_fetcher import save_snapshot, load_snapshot, fetch_world_bank_data
 from app import api as api_routes
+from app import data_fetcher
 
 
 @pytest.fixture(autouse=True)
@@ -32,6 +39,23 @@ def test_get_all():
     assert data[0]["year"] == 2000
 
 
+def test_get_all_paginated_and_streamed():
+    client = TestClient(create_app())
+    r = client.get("/vacunas", params={"limit": 2})
+    assert [d["year"] for d in r.json()["data"]] == [2000, 2001]
+    assert r.headers["x-next-after-year"] == "2001"
+    assert "after_year=2001" in r.headers["link"]
+
+    last = client.get("/vacunas", params={"limit": 2, "after_year": 2001})
+    assert [d["year"] for d in last.json()["data"]] == [2002]
+    assert "x-next-after-year" not in last.headers
+
+    stream = client.get("/vacunas", params={"after_year": 2000}, headers={"Accept": "application/x-ndjson"})
+    assert stream.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in stream.text.splitlines()]
+    assert [(d["year"], d["value"]) for d in lines] == [(2001, 87.3), (2002, None)]
+
+
 def test_get_by_year_found_and_not_found():
     app = create_app()
     client = TestClient(app)
@@ -51,3 +75,251 @@ def test_get_provinces_for_year():
     provs = r.json()
     assert len(provs) >= 10
     assert all(p["year"] == 2001 for p in provs)
+
+
+def test_get_provinces_for_year_without_national_value():
+    app = create_app()
+    client = TestClient(app)
+    r = client.get("/vacunas/2002/provincias")
+    assert r.status_code == 200
+    assert all(p["value"] is None for p in r.json())
+
+
+def test_get_province_stats():
+    app = create_app()
+    client = TestClient(app)
+    r = client.get("/vacunas/provincias/estadisticas")
+    assert r.status_code == 200
+    stats = r.json()
+    assert len(stats) >= 10
+    assert all(s["years"] == 2 for s in stats)
+    assert all(s["min"] <= s["mean"] <= s["max"] for s in stats)
+
+
+def test_get_province_years_ignores_case_and_accents():
+    app = create_app()
+    client = TestClient(app)
+    r = client.get("/vacunas/provincia/cocle")
+    assert r.status_code == 200
+    data = r.json()
+    assert [p["year"] for p in data] == [2000, 2001, 2002]
+    assert all(p["province"] == "Coclé" for p in data)
+
+    assert client.get("/vacunas/provincia/NGABE-BUGLE").status_code == 200
+    assert client.get("/vacunas/provincia/atlantis").status_code == 404
+
+
+def test_range_stats():
+    client = TestClient(create_app())
+    r = client.get("/vacunas/stats")
+    assert r.status_code == 200
+    stats = r.json()
+    assert (stats["years"], stats["mean"], stats["min"], stats["max"]) == (2, 86.15, 85.0, 87.3)
+    assert stats["slope"] == pytest.approx(2.3)
+
+    # 2002 no tiene valor: no cuenta
+    only_2001 = client.get("/vacunas/stats", params={"from": 2001, "to": 2002}).json()
+    assert (only_2001["years"], only_2001["mean"], only_2001["slope"]) == (1, 87.3, None)
+    assert client.get("/vacunas/stats", params={"from": 2002}).json()["years"] == 0
+
+    cocle = client.get("/vacunas/stats", params={"province": "cocle"}).json()
+    assert cocle["province"] == "Coclé" and cocle["years"] == 2
+    assert client.get("/vacunas/stats", params={"province": "atlantis"}).status_code == 404
+    assert client.get("/vacunas/stats", params={"from": 2002, "to": 2000}).status_code == 400
+
+
+def test_etag_and_compressed_responses():
+    app = create_app()
+    client = TestClient(app)
+    r = client.get("/vacunas/2001/provincias", headers={"Accept-Encoding": "gzip"})
+    assert r.status_code == 200
+    assert r.headers["content-encoding"] == "gzip"
+    etag = r.headers["etag"]
+
+    r2 = client.get("/vacunas/2001/provincias", headers={"Accept-Encoding": "gzip", "If-None-Match": etag})
+    assert r2.status_code == 304
+    assert r2.headers["etag"] == etag
+
+    plain = client.get("/vacunas/2001/provincias", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in plain.headers
+    assert plain.headers["etag"] != etag
+    assert plain.json() == r.json()
+
+    # Un repositorio recargado con otros datos invalida las respuestas guardadas
+    api_routes.repo = VaccineRepository([{"country": "Panama", "indicator": "x", "code": "SH.IMM.MEAS",
+                                          "year": 2001, "value": 50.0}])
+    r3 = client.get("/vacunas/2001/provincias", headers={"Accept-Encoding": "gzip", "If-None-Match": etag})
+    assert r3.status_code == 200
+
+
+def test_series_by_country_and_indicator():
+    api_routes.repo = VaccineRepository([
+        {"country": "Panama", "country_code": "PAN", "indicator": "Measles", "code": "SH.IMM.MEAS",
+         "year": 2000, "value": 85.0},
+        {"country": "Costa Rica", "country_code": "CRI", "indicator": "DPT", "code": "SH.IMM.IDPT",
+         "year": 2001, "value": 92.0},
+        {"country": "Costa Rica", "country_code": "CRI", "indicator": "DPT", "code": "SH.IMM.IDPT",
+         "year": 2000, "value": 90.0},
+    ])
+    client = TestClient(create_app())
+    catalog = client.get("/indicadores").json()
+    assert [(s["country_code"], s["code"], s["years"]) for s in catalog] == [
+        ("CRI", "SH.IMM.IDPT", 2), ("PAN", "SH.IMM.MEAS", 1)
+    ]
+    r = client.get("/indicadores/cri/sh.imm.idpt")
+    assert [d["year"] for d in r.json()["data"]] == [2000, 2001]
+    assert client.get("/indicadores/CRI/SH.IMM.IDPT/2001").json()["value"] == 92.0
+    assert client.get("/indicadores/CRI/SH.IMM.MEAS").status_code == 404
+    # /vacunas sigue sirviendo solo la serie principal
+    assert [d["country_code"] for d in client.get("/vacunas").json()["data"]] == ["PAN"]
+
+
+def test_fetch_follows_pagination_for_every_pair():
+    def handler(request):
+        country, indicator = request.url.path.split("/")[-3], request.url.path.split("/")[-1]
+        page = int(request.url.params["page"])
+        rows = [{"country": {"value": country}, "countryiso3code": country,
+                 "indicator": {"id": indicator, "value": indicator}, "date": str(2000 + page), "value": page}]
+        return httpx.Response(200, json=[{"page": page, "pages": 3}, rows])
+
+    records = asyncio.run(fetch_world_bank_data([("PAN", "SH.IMM.MEAS"), ("CRI", "SH.IMM.IDPT")],
+                                                transport=httpx.MockTransport(handler)))
+    assert [(r["country_code"], r["code"], r["year"]) for r in records] == [
+        ("CRI", "SH.IMM.IDPT", 2001), ("CRI", "SH.IMM.IDPT", 2002), ("CRI", "SH.IMM.IDPT", 2003),
+        ("PAN", "SH.IMM.MEAS", 2001), ("PAN", "SH.IMM.MEAS", 2002), ("PAN", "SH.IMM.MEAS", 2003),
+    ]
+
+
+def test_fetch_honours_legacy_wb_api_url(monkeypatch):
+    monkeypatch.setattr(data_fetcher, "WB_API_URL", "https://legacy.example/serie?format=json&per_page=20000")
+    seen = []
+
+    def handler(request):
+        seen.append(str(request.url))
+        indicator = request.url.path.split("/")[-1]
+        rows = [{"country": {"value": "Panama"}, "indicator": {"id": indicator, "value": indicator},
+                 "date": "2001", "value": 90}]
+        return httpx.Response(200, json=[{"page": 1, "pages": 1}, rows])
+
+    records = asyncio.run(fetch_world_bank_data([("PAN", "SH.IMM.MEAS"), ("CRI", "SH.IMM.IDPT")],
+                                                transport=httpx.MockTransport(handler)))
+    assert any(u.startswith("https://legacy.example/serie?") and "per_page=20000" in u for u in seen)
+    assert [(r["country_code"], r["code"]) for r in records] == [("CRI", "SH.IMM.IDPT"), ("PAN", "SH.IMM.MEAS")]
+
+
+def test_fetch_retries_failed_pages(monkeypatch):
+    monkeypatch.setattr(data_fetcher, "WB_BACKOFF", 0)
+    calls = {}
+
+    def handler(request):
+        page = int(request.url.params["page"])
+        calls[page] = calls.get(page, 0) + 1
+        if page == 2 and calls[page] == 1:
+            return httpx.Response(503)
+        if page == 3 and calls[page] == 1:
+            raise httpx.ConnectError("conexión reiniciada")
+        rows = [{"country": {"value": "Panama"}, "countryiso3code": "PAN",
+                 "indicator": {"id": "SH.IMM.MEAS", "value": "x"}, "date": str(2000 + page), "value": page}]
+        return httpx.Response(200, json=[{"page": page, "pages": 3}, rows])
+
+    records = asyncio.run(fetch_world_bank_data([("PAN", "SH.IMM.MEAS")], transport=httpx.MockTransport(handler)))
+    assert [r["year"] for r in records] == [2001, 2002, 2003]
+    assert calls == {1: 1, 2: 2, 3: 2}
+
+    monkeypatch.setattr(data_fetcher, "WB_RETRIES", 1)
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(fetch_world_bank_data([("PAN", "SH.IMM.MEAS")],
+                                          transport=httpx.MockTransport(lambda request: httpx.Response(500))))
+
+
+def test_metrics_by_route_template():
+    client = TestClient(create_app())
+    client.get("/vacunas/2001")
+    client.get("/vacunas/2000")
+    client.get("/vacunas/1999")
+    client.get("/no-existe")
+    r = client.get("/metrics")
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("text/plain")
+    text = r.text
+    assert 'http_requests_total{method="GET",route="/vacunas/{year}",status="200"} 2' in text
+    assert 'http_requests_total{method="GET",route="/vacunas/{year}",status="404"} 1' in text
+    assert 'http_request_duration_seconds_count{route="/vacunas/{year}"} 3' in text
+    assert 'route="/no-existe"' not in text
+    assert "repository_records 3" in text
+
+
+def test_startup_serves_snapshot_when_world_bank_is_down(tmp_path):
+    snapshot = str(tmp_path / "snapshot.json")
+    save_snapshot([{"country": "Panama", "indicator": "Immunization, measles (% of children ages 12-23 months)",
+                    "code": "SH.IMM.MEAS", "year": 1999, "value": 90.0}], snapshot)
+
+    async def unreachable():
+        raise ConnectionError("sin red")
+
+    app = create_app(RepositoryLoader(fetcher=unreachable, snapshot_path=snapshot))
+    with TestClient(app) as client:
+        r = client.get("/vacunas")
+        assert r.status_code == 200
+        assert [d["year"] for d in r.json()["data"]] == [1999]
+
+
+def test_concurrent_snapshot_saves_never_tear(tmp_path):
+    snapshot = str(tmp_path / "snapshot.json")
+    batches = [[{"country": "Panama", "indicator": "x", "code": "SH.IMM.MEAS", "year": 1960 + i, "value": float(w)}
+                for i in range(2000)] for w in range(8)]
+    with ThreadPoolExecutor(len(batches)) as pool:
+        list(pool.map(lambda records: save_snapshot(records, snapshot), batches))
+    records, _ = load_snapshot(snapshot)
+    assert records in batches
+    assert [p.name for p in tmp_path.iterdir()] == ["snapshot.json"]
+
+
+def test_startup_fetches_and_writes_snapshot(tmp_path):
+    snapshot = str(tmp_path / "snapshot.json")
+    fresh = [{"country": "Panama", "indicator": "Immunization, measles (% of children ages 12-23 months)",
+              "code": "SH.IMM.MEAS", "year": 2010, "value": 95.0}]
+
+    async def fetch():
+        return fresh
+
+    app = create_app(RepositoryLoader(fetcher=fetch, snapshot_path=snapshot, interval=0))
+    with TestClient(app) as client:
+        assert client.get("/vacunas/2010").json()["value"] == 95.0
+    records, _ = load_snapshot(snapshot)
+    assert records == fresh
+
+
+def test_workers_share_one_mapped_dataset(tmp_path):
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        return [{"country": "Panama", "indicator": "Measles", "code": "SH.IMM.MEAS", "year": 2000 + len(calls),
+                 "value": 90.0 + len(calls)}]
+
+    async def scenario():
+        shared = str(tmp_path / "shared")
+        leader = RepositoryLoader(fetcher=fetch, snapshot_path=str(tmp_path / "a.json"), shared_dir=shared)
+        follower = RepositoryLoader(fetcher=fetch, snapshot_path=str(tmp_path / "b.json"), shared_dir=shared)
+        await leader.start()
+        await follower.start()
+        try:
+            assert (leader.is_leader, follower.is_leader) == (True, False)
+            assert len(calls) == 1
+            assert [r.year for r in api_routes.repo.all()] == [2001]
+
+            # Una recarga del cargador publica otra versión que el resto adopta sin reiniciar
+            await leader.refresh()
+            api_routes.repo = None
+            assert await follower.adopt_shared()
+            assert [(r.year, r.value) for r in api_routes.repo.all()] == [(2002, 92.0)]
+            assert len(calls) == 2
+        finally:
+            await leader.stop()
+            await follower.stop()
+        # Liberado el flock, otro worker puede tomar el relevo
+        assert follower.store.try_acquire()
+        follower.store.release()
+
+    asyncio.run(scenario())